@@ -0,0 +1,149 @@
+# Per-customer daily activity matrix
+#
+# Materializes usage_events as customers x days arrays stored as memory-mapped
+# .npy files in data/processed/activity, only as running totals (one extra
+# leading column) in the smallest unsigned type that holds them:
+# - <event_type>_prefix.npy       events of that type up to each day
+# - active_days_prefix.npy        days with any event up to each day
+#
+# With the prefix arrays any window sum or distinct-active-day count is two
+# lookups per customer, independent of the window length and of how many raw
+# events there are:
+#   matrix = ActivityMatrix.open()
+#   logins = matrix.window_sum("login", start, end)
+#
+# Windows are whole calendar days: [start, end) covers every event on the days
+# from start's day up to (not including) end's day, whatever their time of
+# day. That equals a timestamp window (start <= timestamp < end) only when
+# start and end fall on midnight.
+
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from core.data.loader import RAW_PATH, fingerprint, load_table, source_files
+
+ACTIVITY_PATH = Path("data/processed/activity")
+META_FILE = "meta.json"
+BLOCK_CUSTOMERS = 10000 # customers materialized at a time while building
+
+
+def source_fingerprint(raw_path=RAW_PATH):
+    return fingerprint(source_files("usage_events", raw_path) + source_files("customers", raw_path))
+
+
+def build_activity_matrix(output_path=ACTIVITY_PATH, raw_path=RAW_PATH):
+    customers = load_table("customers", raw_path)
+    events = load_table("usage_events", raw_path)
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    for stale in output_path.glob("*.npy"):
+        stale.unlink()
+
+    n_customers = len(customers)
+    start = events["timestamp"].min().floor("D")
+    n_days = (events["timestamp"].max().floor("D") - start).days + 1
+    # Event types are compared as their small integer category codes, never as
+    # per-row strings
+    event_type = events["event_type"].astype("category")
+    present = np.flatnonzero(np.bincount(event_type.cat.codes.to_numpy() + 1)[1:])
+    type_codes = {str(event_type.cat.categories[c]): c for c in present}
+    event_types = sorted(type_codes)
+
+    # Rows ordered by customer once, so each block of customers is one slice
+    codes = events["customer_code"].to_numpy()
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    codes = codes[order]
+    days = ((events["timestamp"].to_numpy()[order] - start.to_datetime64()) // np.timedelta64(1, "D")).astype(np.int64)
+    types = event_type.cat.codes.to_numpy()[order]
+
+    def create(name, largest, n_cols):
+        # Running totals never exceed the largest customer total
+        dtype = np.min_scalar_type(max(int(largest), 1))
+        return np.lib.format.open_memmap(output_path / f"{name}.npy", mode="w+", dtype=dtype, shape=(n_customers, n_cols))
+
+    def largest_total(t):
+        return np.bincount(codes[types == type_codes[t]], minlength=n_customers).max(initial=0)
+
+    prefixes = {t: create(f"{t}_prefix", largest_total(t), n_days + 1) for t in event_types}
+    active_prefix = create("active_days_prefix", n_days, n_days + 1)
+
+    for first in range(0, n_customers, BLOCK_CUSTOMERS):
+        last = min(first + BLOCK_CUSTOMERS, n_customers)
+        lo, hi = np.searchsorted(codes, [first, last])
+        block_size = last - first
+        cells = (codes[lo:hi] - first) * n_days + days[lo:hi]
+        any_activity = np.zeros((block_size, n_days), dtype=bool)
+
+        for t in event_types:
+            is_type = types[lo:hi] == type_codes[t]
+            block = np.bincount(cells[is_type], minlength=block_size * n_days).reshape(block_size, n_days)
+            prefixes[t][first:last, 1:] = np.cumsum(block, axis=1)
+            any_activity |= block > 0
+
+        active_prefix[first:last, 1:] = np.cumsum(any_activity, axis=1)
+
+    for array in [*prefixes.values(), active_prefix]:
+        array.flush()
+
+    meta = {
+        "start_date": f"{start:%Y-%m-%d}",
+        "n_days": int(n_days),
+        "n_customers": int(n_customers),
+        "event_types": event_types,
+        "source_fingerprint": source_fingerprint(raw_path),
+    }
+    (output_path / META_FILE).write_text(json.dumps(meta, indent=2))
+    return ActivityMatrix(output_path)
+
+
+class ActivityMatrix:
+    def __init__(self, path=ACTIVITY_PATH):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META_FILE).read_text())
+        self.start = pd.Timestamp(self.meta["start_date"])
+        self.n_days = self.meta["n_days"]
+        self.event_types = self.meta["event_types"]
+        self._arrays = {}
+
+    @classmethod
+    def open(cls, path=ACTIVITY_PATH, raw_path=RAW_PATH):
+        # The matrix if it exists and was built from the current raw data, else None
+        path = Path(path)
+        if not (path / META_FILE).exists():
+            return None
+        matrix = cls(path)
+        if matrix.meta["source_fingerprint"] != source_fingerprint(raw_path):
+            return None
+        return matrix
+
+    def array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._arrays[name]
+
+    def day_index(self, date):
+        # Column of the calendar day containing date, clipped to [0, n_days]
+        day = (pd.Timestamp(date).floor("D") - self.start).days
+        return int(np.clip(day, 0, self.n_days))
+
+    def _rows(self, prefix, start, end, codes):
+        s, e = self.day_index(start), self.day_index(end)
+        if codes is None:
+            return prefix[:, e].astype(np.int64) - prefix[:, s]
+        return prefix[codes, e].astype(np.int64) - prefix[codes, s]
+
+    def window_sum(self, event_type, start, end, codes=None):
+        # Events of event_type on calendar days in [start, end), per customer
+        return self._rows(self.array(f"{event_type}_prefix"), start, end, codes)
+
+    def active_days(self, start, end, codes=None):
+        # Distinct calendar days in [start, end) with any event, per customer
+        return self._rows(self.array("active_days_prefix"), start, end, codes)
+
+
+if __name__ == "__main__":
+    matrix = build_activity_matrix()
+    print("Activity matrix built successfully.")
+    print(f"Customers x days: {matrix.meta['n_customers']} x {matrix.n_days}")
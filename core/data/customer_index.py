@@ -0,0 +1,34 @@
+# Customer ID dictionary
+#
+# Maps the 36-char customer_id UUIDs to dense int32 codes (their row position
+# in customers.csv) and back. Feature code groups and joins on the codes and
+# only turns them back into UUIDs when writing output.
+
+import numpy as np
+import pandas as pd
+
+UNKNOWN_CUSTOMER = -1
+
+
+class CustomerIndex:
+    def __init__(self, customer_ids):
+        self.ids = pd.Index(np.asarray(customer_ids, dtype=object), name="customer_id")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, customer_ids):
+        # Unknown ids are encoded as UNKNOWN_CUSTOMER
+        if isinstance(customer_ids, pd.Series) and isinstance(customer_ids.dtype, pd.CategoricalDtype):
+            # Hash each distinct id once instead of once per row
+            category_codes = self.ids.get_indexer(customer_ids.cat.categories).astype(np.int32)
+            row_codes = customer_ids.cat.codes.to_numpy()
+            return np.where(row_codes >= 0, category_codes[row_codes], UNKNOWN_CUSTOMER).astype(np.int32)
+
+        return self.ids.get_indexer(customer_ids).astype(np.int32)
+
+    def decode(self, codes):
+        return self.ids.to_numpy()[np.asarray(codes)]
+
+    def codes(self):
+        return pd.RangeIndex(len(self.ids), name="customer_code")
@@ -0,0 +1,197 @@
+# Shared raw-data loader
+#
+# Every raw table is parsed once and stored as a typed Parquet cache in
+# data/cache, keyed by the source file's size and mtime. Later loads (from any
+# script) read the cache instead of re-parsing the CSV, and tables loaded in
+# the same process are kept in memory and shared between builders (treat them
+# as read-only).
+#
+# Every table also carries an int32 customer_code column (see CustomerIndex),
+# which is what the feature builders group and join on.
+
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from core.data.customer_index import CustomerIndex
+
+RAW_PATH = Path("data/raw")
+CACHE_PATH = Path("data/cache")
+CHUNK_ROWS = 1_000_000 # rows per chunk for out-of-core reads
+
+# Per-table column types for the cache
+RAW_TABLES = {
+    "customers": {
+        "dates": ["signup_date"],
+        "categories": ["plan_type", "region", "company_size"],
+        "integers": {},
+    },
+    "subscriptions": {
+        "dates": ["billing_date"],
+        "categories": ["status", "plan_type"],
+        "integers": {"amount": "int32"},
+    },
+    "usage_events": {
+        "dates": ["timestamp"],
+        "categories": ["event_type"],
+        "integers": {},
+    },
+    "support_tickets": {
+        "dates": ["ticket_date"],
+        "categories": ["issue_type"],
+        "integers": {"resolution_hours": "int32"},
+    },
+}
+
+_loaded = {}
+_indexes = {}
+
+
+def source_files(name, raw_path=RAW_PATH):
+    # A raw table is either <name>.csv or a directory of Parquet parts written
+    # by the sharded data generator
+    raw_path = Path(raw_path)
+    csv_path = raw_path / f"{name}.csv"
+    if csv_path.exists():
+        return [csv_path]
+
+    parts = sorted((raw_path / name).glob("*.parquet"))
+    if parts:
+        return parts
+
+    raise FileNotFoundError(f"No raw data found for '{name}' in {raw_path}")
+
+
+def fingerprint(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def optimize_dtypes(name, df):
+    spec = RAW_TABLES.get(name, {})
+
+    for col in spec.get("dates", []):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    for col in spec.get("categories", []):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col, dtype in spec.get("integers", {}).items():
+        # Only narrow columns that really are integral
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype(dtype)
+
+    return df
+
+
+def read_source(name, paths):
+    if paths[0].suffix == ".csv":
+        return pd.read_csv(paths[0])
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+
+def add_customer_codes(name, df, raw_path, cache_path):
+    if name == "customers":
+        df.insert(0, "customer_code", np.arange(len(df), dtype=np.int32))
+        return df
+
+    index = customer_index(raw_path, cache_path)
+    df["customer_id"] = df["customer_id"].astype("category")
+    df.insert(0, "customer_code", index.encode(df["customer_id"]))
+    return df
+
+
+def cache_key(name, raw_path=RAW_PATH):
+    paths = source_files(name, raw_path)
+    key_paths = paths
+    if name != "customers":
+        # Codes depend on customers.csv, so it is part of every table's key
+        key_paths = paths + source_files("customers", raw_path)
+    return paths, fingerprint(key_paths)
+
+
+def load_table(name, raw_path=RAW_PATH, cache_path=CACHE_PATH):
+    paths, fp = cache_key(name, raw_path)
+    key = (name, fp)
+    if key in _loaded:
+        return _loaded[key]
+
+    cache_path = Path(cache_path)
+    cache_file = cache_path / f"{name}-{fp}.parquet"
+
+    if cache_file.exists():
+        df = pd.read_parquet(cache_file)
+    else:
+        df = optimize_dtypes(name, read_source(name, paths))
+        df = add_customer_codes(name, df, raw_path, cache_path)
+
+        cache_path.mkdir(parents=True, exist_ok=True)
+        for stale in cache_path.glob(f"{name}-*.parquet"):
+            if stale != cache_file:
+                stale.unlink(missing_ok=True)
+        # Written under a private name and renamed, so pipeline stages running
+        # in parallel never read a half-written cache file
+        tmp_file = cache_path / f".{cache_file.name}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, cache_file)
+
+    _loaded[key] = df
+    return df
+
+
+def iter_chunks(name, columns=None, chunk_rows=CHUNK_ROWS, raw_path=RAW_PATH, cache_path=CACHE_PATH):
+    # Yields the table in typed chunks of at most chunk_rows rows, each with its
+    # customer_code column, without ever holding the whole table. Reads the
+    # Parquet cache when it exists, else the raw CSV or Parquet parts.
+    if name == "customers":
+        raise ValueError("customers defines the customer codes; load it with load_table")
+    paths, fp = cache_key(name, raw_path)
+    cache_file = Path(cache_path) / f"{name}-{fp}.parquet"
+    read_columns = None if columns is None else ["customer_code", *columns]
+
+    if cache_file.exists():
+        for batch in pq.ParquetFile(cache_file).iter_batches(chunk_rows, columns=read_columns):
+            yield batch.to_pandas()
+        return
+
+    # Raw sources have no codes yet: they are encoded from customer_id
+    if columns is not None:
+        read_columns = ["customer_id", *[c for c in columns if c != "customer_id"]]
+    if paths[0].suffix == ".csv":
+        chunks = pd.read_csv(paths[0], usecols=read_columns, chunksize=chunk_rows)
+    else:
+        chunks = (
+            batch.to_pandas()
+            for path in paths
+            for batch in pq.ParquetFile(path).iter_batches(chunk_rows, columns=read_columns)
+        )
+
+    for chunk in chunks:
+        chunk = optimize_dtypes(name, chunk)
+        chunk = add_customer_codes(name, chunk, raw_path, cache_path)
+        yield chunk if columns is None else chunk[["customer_code", *columns]]
+
+
+def column_max(name, column, chunk_rows=CHUNK_ROWS, raw_path=RAW_PATH, cache_path=CACHE_PATH):
+    return max(
+        chunk[column].max()
+        for chunk in iter_chunks(name, [column], chunk_rows, raw_path, cache_path)
+        if len(chunk)
+    )
+
+
+def customer_index(raw_path=RAW_PATH, cache_path=CACHE_PATH):
+    key = fingerprint(source_files("customers", raw_path))
+    if key not in _indexes:
+        customers = load_table("customers", raw_path, cache_path)
+        _indexes[key] = CustomerIndex(customers["customer_id"])
+    return _indexes[key]
+
+
+def load_tables(*names, raw_path=RAW_PATH, cache_path=CACHE_PATH):
+    return [load_table(name, raw_path, cache_path) for name in names]
@@ -0,0 +1,151 @@
+# Time-partitioned Parquet layout for the event tables
+#
+# usage_events, subscriptions and support_tickets are rewritten from the loader
+# cache as hive-style monthly partitions:
+#   data/partitioned/<table>/month=YYYYMM/part-0.parquet
+# with rows ordered by customer code inside each month, plus metadata with
+# the source fingerprint and the table's time range (_meta.json).
+#
+# read_table pushes a builder's date range down to the partitions (only the
+# months overlapping [start, end) are opened), its equality / isin filters
+# down to Parquet row groups, and reads only the requested columns. When the
+# layout is missing or stale it falls back to the loader cache and filters in
+# memory, so builders get the same rows either way:
+#   events = read_table("usage_events", ["timestamp"], start=T_ref - pd.Timedelta(days=30))
+
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pathlib import Path
+from core.data.loader import RAW_PATH, cache_key, load_table, optimize_dtypes
+
+PARTITIONED_PATH = Path("data/partitioned")
+META_FILE = "_meta.json" # leading underscore: skipped by the Parquet dataset scan
+
+# Table -> the time column it is partitioned on
+TIME_COLUMNS = {
+    "usage_events": "timestamp",
+    "subscriptions": "billing_date",
+    "support_tickets": "ticket_date",
+}
+
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.int32())]), flavor="hive")
+
+
+def month_key(times):
+    return times.dt.year * 100 + times.dt.month
+
+
+def write_partitioned(name, raw_path=RAW_PATH, output_path=PARTITIONED_PATH):
+    time_col = TIME_COLUMNS[name]
+    df = load_table(name, raw_path)
+    table_path = Path(output_path) / name
+
+    order = np.lexsort([df["customer_code"].to_numpy(), month_key(df[time_col]).to_numpy()])
+    df = df.iloc[order].assign(month=month_key(df[time_col]).to_numpy()[order].astype(np.int32))
+
+    shutil.rmtree(table_path, ignore_errors=True)
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        table_path,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=128 * 1024,
+    )
+
+    meta = {
+        "source_fingerprint": cache_key(name, raw_path)[1],
+        "time_column": time_col,
+        "min_time": f"{df[time_col].min()}",
+        "max_time": f"{df[time_col].max()}",
+        "rows": len(df),
+    }
+    (table_path / META_FILE).write_text(json.dumps(meta, indent=2))
+    return PartitionedTable(table_path)
+
+
+class PartitionedTable:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META_FILE).read_text())
+        self.time_col = self.meta["time_column"]
+        self.dataset = ds.dataset(self.path, format="parquet", partitioning=PARTITIONING)
+
+    @classmethod
+    def open(cls, name, raw_path=RAW_PATH, output_path=PARTITIONED_PATH):
+        # The partitioned table if it was written from the current raw data, else None
+        path = Path(output_path) / name
+        if not (path / META_FILE).exists():
+            return None
+        table = cls(path)
+        if table.meta["source_fingerprint"] != cache_key(name, raw_path)[1]:
+            return None
+        return table
+
+    def max_time(self):
+        return pd.Timestamp(self.meta["max_time"])
+
+    def read(self, columns=None, start=None, end=None, where=None):
+        time = ds.field(self.time_col)
+        month = ds.field("month")
+        condition = None
+
+        def both(a, b):
+            return b if a is None else a & b
+
+        if start is not None:
+            start = pd.Timestamp(start)
+            condition = both(condition, (month >= start.year * 100 + start.month) & (time >= start.to_pydatetime()))
+        if end is not None:
+            end = pd.Timestamp(end)
+            condition = both(condition, (month <= end.year * 100 + end.month) & (time < end.to_pydatetime()))
+        for col, value in (where or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            condition = both(condition, ds.field(col).isin(list(values)))
+
+        columns = [c for c in self.dataset.schema.names if c != "month"] if columns is None else columns
+        return self.dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def read_table(name, columns=None, start=None, end=None, where=None, raw_path=RAW_PATH):
+    # Rows of an event table with start <= time < end (either bound optional)
+    # matching where ({column: value or list of values}), with customer_code
+    # and the requested columns
+    columns = None if columns is None else list(dict.fromkeys(["customer_code", *columns]))
+    table = PartitionedTable.open(name, raw_path) if name in TIME_COLUMNS else None
+    if table is not None:
+        return optimize_dtypes(name, table.read(columns, start, end, where))
+
+    df = load_table(name, raw_path)
+    mask = np.ones(len(df), dtype=bool)
+    time_col = TIME_COLUMNS.get(name)
+    if start is not None:
+        mask &= (df[time_col] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (df[time_col] < pd.Timestamp(end)).to_numpy()
+    for col, value in (where or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= df[col].isin(values).to_numpy()
+
+    df = df if mask.all() else df[mask]
+    return df if columns is None else df[columns]
+
+
+def max_time(name, raw_path=RAW_PATH):
+    # Latest time in an event table, from the partition metadata when available
+    table = PartitionedTable.open(name, raw_path)
+    if table is not None:
+        return table.max_time()
+    return load_table(name, raw_path)[TIME_COLUMNS[name]].max()
+
+
+if __name__ == "__main__":
+    for name in TIME_COLUMNS:
+        table = write_partitioned(name)
+        months = len(list(table.path.glob("month=*")))
+        print(f"{name}: {table.meta['rows']} rows in {months} monthly partitions")
+    print("Partitioned tables written successfully.")
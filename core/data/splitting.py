@@ -25,3 +25,30 @@ def get_train_test_split(modeling_df, split_ratio = 3/4):
     test_df  = modeling_df[modeling_df["signup_date"] > cutoff_date].copy()
 
     return train_df, test_df
+
+
+def get_rolling_origin_folds(anchor_dates, n_folds=4, horizon_days=45, min_train_anchors=3):
+    # Chronological train/validation folds over anchor-dated snapshots sorted by
+    # anchor_date. Fold k validates on one of the last n_folds anchors and
+    # trains on every earlier anchor whose label horizon has closed by then
+    # (anchor + horizon_days <= validation anchor), so no training label looks
+    # past the validation date.
+    #
+    # Folds are (train, valid) slices: on the sorted table each side is one
+    # contiguous block of rows, so X[train] and X[valid] are views, not copies.
+    anchor_dates = pd.DatetimeIndex(anchor_dates)
+    if not anchor_dates.is_monotonic_increasing:
+        raise ValueError("Snapshots must be sorted by anchor_date")
+
+    anchors = anchor_dates.unique()
+    folds = []
+    for valid_anchor in anchors[-n_folds:]:
+        train_anchors = anchors[anchors + pd.Timedelta(days=horizon_days) <= valid_anchor]
+        if len(train_anchors) < min_train_anchors:
+            continue
+        train_end = anchor_dates.searchsorted(train_anchors[-1], side="right")
+        valid_start = anchor_dates.searchsorted(valid_anchor, side="left")
+        valid_end = anchor_dates.searchsorted(valid_anchor, side="right")
+        folds.append((slice(0, train_end), slice(valid_start, valid_end), valid_anchor))
+
+    return folds
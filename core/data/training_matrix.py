@@ -0,0 +1,82 @@
+# Training matrix preparation straight from Parquet
+#
+# Reads a modeling table into one C-contiguous float32 feature matrix and a
+# label vector without going through pandas: each Arrow column is written once
+# into its column of the preallocated matrix. Splits are not copies either -
+# rows are ordered by the split key at read time, so the signup-date split of
+# get_train_test_split is a prefix / suffix slice and X[train], X[test] are
+# views that DMatrix / QuantileDMatrix consume directly.
+
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from core.data.loader import customer_index, load_table
+
+NON_FEATURES = ("customer_id", "churn_label", "anchor_date", "signup_date")
+
+
+@dataclass
+class TrainingMatrix:
+    X: np.ndarray  # (rows, features) float32, C-contiguous
+    y: np.ndarray  # int32 labels
+    feature_names: list
+    customer_id: np.ndarray
+    train: slice = None
+    test: slice = None
+
+
+def read_matrix(path, label="churn_label", exclude=NON_FEATURES, order_by=None):
+    # (X, y, feature names, arrow table of the non-feature columns). order_by,
+    # if given, is an array of sort keys (one per row) that fixes the row order.
+    table = pq.read_table(path)
+    feature_names = [c for c in table.column_names if c not in exclude and c != label]
+
+    rows = None
+    if order_by is not None:
+        rows = np.argsort(order_by, kind="stable")
+        if (rows == np.arange(len(rows))).all():
+            rows = None
+
+    def values(name):
+        # Arrow buffer as an array (zero-copy for numeric columns without nulls)
+        array = table.column(name).to_numpy(zero_copy_only=False)
+        return array if rows is None else array[rows]
+
+    X = np.empty((table.num_rows, len(feature_names)), dtype=np.float32)
+    for j, name in enumerate(feature_names):
+        # Each column is written once into X, converted to float32 on the way in
+        X[:, j] = values(name)
+
+    y = values(label).astype(np.int32)
+    extra = table.select([c for c in table.column_names if c in exclude])
+    return X, y, feature_names, extra if rows is None else extra.take(rows)
+
+
+def signup_dates(ids):
+    # Signup date of each customer_id; NaT for ids missing from customers, as
+    # the left merge in get_modeling_df gives them
+    codes = customer_index().encode(pd.Index(ids))
+    signup = load_table("customers")["signup_date"].to_numpy()[np.maximum(codes, 0)]
+    signup[codes < 0] = np.datetime64("NaT")
+    return signup
+
+
+def load_training_matrix(path, split_ratio=3/4):
+    # Modeling table ordered by signup date; train holds the customers who
+    # signed up on or before the split_ratio quantile, as in get_train_test_split.
+    # Rows of unknown customers sort last (NaT) and are in neither split.
+    ids = pq.read_table(path, columns=["customer_id"]).column("customer_id").to_numpy(zero_copy_only=False)
+    signup = signup_dates(ids)
+
+    X, y, feature_names, extra = read_matrix(path, order_by=signup)
+    signup = np.sort(signup, kind="stable")
+    known = int((~np.isnat(signup)).sum())
+    cutoff = pd.Series(signup[:known]).quantile(split_ratio)
+    split = int(np.searchsorted(signup[:known], cutoff.to_datetime64(), side="right"))
+
+    return TrainingMatrix(
+        X=X, y=y, feature_names=feature_names,
+        customer_id=extra.column("customer_id").to_numpy(zero_copy_only=False),
+        train=slice(0, split), test=slice(split, known),
+    )
@@ -0,0 +1,327 @@
+# Windowed aggregation engine
+#
+# Feature builders describe their per-customer features as WindowFeature specs
+# and aggregate_windows computes all of them for a table in one pass: the
+# table is ordered by customer code once, each window and each distinct filter
+# is evaluated once, and every aggregation is a vectorized bincount / reduceat
+# over the dense customer codes. Adding a feature adds an aggregation, not
+# another scan and merge.
+#
+# For tables larger than memory, WindowAccumulator and PeriodSlopeAccumulator
+# compute the same features from a stream of row chunks (see
+# core.data.loader.iter_chunks), keeping only per-customer partials.
+
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+AGGREGATIONS = {"count", "sum", "mean", "nunique", "max", "min"}
+DAY_NS = pd.Timedelta(days=1).value
+
+
+@dataclass
+class WindowFeature:
+    name: str
+    agg: str
+    window_days: int = None  # rows with timestamp >= T_ref - window_days; None = full history
+    column: str = None  # value column (unused for count); datetimes count distinct calendar days for nunique
+    where: dict = field(default_factory=dict)  # equality filters, {column: value}
+
+    def __post_init__(self):
+        if self.agg not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{self.agg}' for feature '{self.name}'")
+        if self.agg != "count" and self.column is None:
+            raise ValueError(f"Feature '{self.name}' needs a value column for '{self.agg}'")
+
+
+class _SortedTable:
+    # The table's rows ordered by customer code, with masks and value columns
+    # materialized at most once
+
+    def __init__(self, df, time_col, t_ref, code_col):
+        codes = df[code_col].to_numpy()
+        # Already customer-grouped inputs make this stable sort close to linear
+        self.order = np.argsort(codes, kind="stable")
+        self.order = self.order[codes[self.order] >= 0]  # drop unknown customers
+        self.codes = codes[self.order]
+        self.df = df
+        self.time_col = time_col
+        self.t_ref = t_ref
+        self._columns = {}
+        self._masks = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            series = self.df[name]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = series.cat.codes.to_numpy()
+            elif pd.api.types.is_datetime64_any_dtype(series):
+                values = series.to_numpy().astype("datetime64[ns]").view(np.int64)
+            else:
+                values = series.to_numpy()
+            self._columns[name] = values[self.order]
+        return self._columns[name]
+
+    def window_mask(self, window_days):
+        key = ("window", window_days)
+        if key not in self._masks:
+            if window_days is None:
+                self._masks[key] = np.ones(len(self.codes), dtype=bool)
+            else:
+                start = (self.t_ref - pd.Timedelta(days=window_days)).as_unit("ns").value
+                self._masks[key] = self.column(self.time_col) >= start
+        return self._masks[key]
+
+    def filter_mask(self, col, value):
+        key = ("where", col, value)
+        if key not in self._masks:
+            series = self.df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                categories = series.cat.categories
+                target = categories.get_loc(value) if value in categories else -2
+                self._masks[key] = self.column(col) == target
+            else:
+                self._masks[key] = self.column(col) == value
+        return self._masks[key]
+
+    def mask(self, feature):
+        mask = self.window_mask(feature.window_days)
+        for col, value in feature.where.items():
+            mask = mask & self.filter_mask(col, value)
+        return mask
+
+
+def _grouped_reduce(ufunc, codes, values, n_customers, fill=np.nan):
+    # codes are sorted, so every customer is one contiguous run
+    out = np.full(n_customers, fill, dtype=np.result_type(values, np.asarray(fill)))
+    if len(codes):
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        out[codes[starts]] = ufunc.reduceat(values, starts)
+    return out
+
+
+def _nunique(codes, values, n_customers):
+    if not len(codes):
+        return np.zeros(n_customers, dtype=np.int64)
+    values = values - values.min()
+    span = int(values.max()) + 1
+    pairs = np.unique(codes.astype(np.int64) * span + values)
+    return np.bincount(pairs // span, minlength=n_customers)
+
+
+def aggregate_windows(df, time_col, t_ref, features, n_customers, code_col="customer_code"):
+    # Returns one column per feature, indexed by customer code (0..n_customers-1).
+    # Customers without matching rows get 0 for count/sum/nunique and NaN (NaT) otherwise.
+    table = _SortedTable(df, time_col, t_ref, code_col)
+    out = {}
+
+    for feature in features:
+        mask = table.mask(feature)
+        codes = table.codes[mask]
+
+        if feature.agg == "count":
+            out[feature.name] = np.bincount(codes, minlength=n_customers)
+            continue
+
+        values = table.column(feature.column)[mask]
+        is_datetime = pd.api.types.is_datetime64_any_dtype(df[feature.column])
+
+        if feature.agg == "sum":
+            result = np.bincount(codes, weights=values, minlength=n_customers)
+        elif feature.agg == "mean":
+            counts = np.bincount(codes, minlength=n_customers)
+            sums = np.bincount(codes, weights=values, minlength=n_customers)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result = np.where(counts > 0, sums / counts, np.nan)
+        elif feature.agg == "nunique":
+            if is_datetime:
+                values = values // DAY_NS
+            result = _nunique(codes, values, n_customers)
+        else:
+            ufunc = np.maximum if feature.agg == "max" else np.minimum
+            if is_datetime:
+                nat = np.iinfo(np.int64).min
+                result = _grouped_reduce(ufunc, codes, values, n_customers, fill=nat)
+                result = pd.to_datetime(result.view("datetime64[ns]"))
+            else:
+                result = _grouped_reduce(ufunc, codes, values.astype(np.float64), n_customers)
+
+        out[feature.name] = result
+
+    return pd.DataFrame(out, index=pd.RangeIndex(n_customers, name="customer_code"))
+
+
+def period_slope(df, time_col, t_ref, window_days, n_customers, period_days=7,
+                 value_col=None, where=None, code_col="customer_code"):
+    # Per-customer least-squares slope of per-period totals (row counts, or sums
+    # of value_col) against the period index, where period 0 ends at T_ref and
+    # the index counts back in time. Only periods with at least one row are
+    # points; customers with fewer than two points or a zero denominator get 0.
+    #
+    # The fit is closed form from grouped sums (see closed_form_slope).
+    rows, totals = period_totals(df, time_col, t_ref, window_days, n_customers, period_days,
+                                 value_col, where, code_col)
+    return slope_from_periods(rows, totals, n_customers)
+
+
+def period_totals(df, time_col, t_ref, window_days, n_customers, period_days=7,
+                  value_col=None, where=None, code_col="customer_code"):
+    # Row counts and value totals per (customer, period), flattened as
+    # code * n_periods + period. Both are plain sums, so totals of row chunks add up.
+    # Rows after T_ref are left out: they would get a negative period.
+    window_start = t_ref - pd.Timedelta(days=window_days)
+    times = df[time_col]
+    mask = ((times >= window_start) & (times <= t_ref)).to_numpy() & (df[code_col] >= 0).to_numpy()
+    for col, value in (where or {}).items():
+        mask &= (df[col] == value).to_numpy()
+
+    codes = df[code_col].to_numpy()[mask].astype(np.int64)
+    age_days = (t_ref - times[mask]).dt.days.to_numpy()
+    n_periods = window_days // period_days + 1
+    key = codes * n_periods + age_days // period_days
+
+    rows = np.bincount(key, minlength=n_customers * n_periods)
+    if value_col is None:
+        totals = rows
+    else:
+        totals = np.bincount(key, weights=df[value_col].to_numpy()[mask], minlength=len(rows))
+    return rows, totals
+
+
+def slope_from_periods(rows, totals, n_customers):
+    n_periods = len(rows) // n_customers
+    points = np.flatnonzero(rows)
+    owner = points // n_periods
+    x = (points % n_periods).astype(np.float64)
+    y = totals[points].astype(np.float64)
+
+    n = np.bincount(owner, minlength=n_customers)
+    sum_x = np.bincount(owner, weights=x, minlength=n_customers)
+    sum_y = np.bincount(owner, weights=y, minlength=n_customers)
+    sum_xy = np.bincount(owner, weights=x * y, minlength=n_customers)
+    sum_xx = np.bincount(owner, weights=x * x, minlength=n_customers)
+
+    slope = closed_form_slope(n, sum_x, sum_y, sum_xy, sum_xx)
+    return pd.Series(slope, index=pd.RangeIndex(n_customers, name="customer_code"))
+
+
+def closed_form_slope(n, sum_x, sum_y, sum_xy, sum_xx):
+    # slope = (n Σxy - Σx Σy) / (n Σx² - (Σx)²), 0 where undefined
+    numerator = n * sum_xy - sum_x * sum_y
+    denominator = n * sum_xx - sum_x * sum_x
+    valid = (n >= 2) & (denominator != 0)
+
+    slope = np.zeros(len(n))
+    slope[valid] = numerator[valid] / denominator[valid]
+    return slope
+
+
+class WindowAccumulator:
+    # aggregate_windows over a table read in chunks. Every feature keeps
+    # per-customer partials that merge across chunks (counts and sums add,
+    # max/min fold), so memory is bounded by the customers, not the rows.
+    # nunique is supported for datetime columns in a window of up to 63 days,
+    # kept as a per-customer bitmask of calendar days.
+
+    def __init__(self, time_col, t_ref, features, n_customers, code_col="customer_code"):
+        self.time_col = time_col
+        self.t_ref = t_ref
+        self.features = features
+        self.n_customers = n_customers
+        self.code_col = code_col
+        self.partials = {}
+        self.datetime_columns = set()
+
+        for feature in features:
+            if feature.agg == "nunique" and (feature.window_days is None or feature.window_days > 62):
+                raise ValueError(f"Feature '{feature.name}': chunked nunique needs a window of at most 62 days")
+            if feature.agg in ("count", "sum", "mean"):
+                self.partials[feature.name] = [np.zeros(n_customers, dtype=np.int64), np.zeros(n_customers)]
+            elif feature.agg == "nunique":
+                self.partials[feature.name] = np.zeros(n_customers, dtype=np.uint64)
+            else:
+                self.partials[feature.name] = None  # created with the first chunk's value type
+
+    def update(self, chunk):
+        table = _SortedTable(chunk, self.time_col, self.t_ref, self.code_col)
+
+        for feature in self.features:
+            mask = table.mask(feature)
+            codes = table.codes[mask]
+            partial = self.partials[feature.name]
+
+            if feature.agg == "count":
+                partial[0] += np.bincount(codes, minlength=self.n_customers)
+                continue
+
+            values = table.column(feature.column)[mask]
+            is_datetime = pd.api.types.is_datetime64_any_dtype(chunk[feature.column])
+            if is_datetime:
+                self.datetime_columns.add(feature.column)
+
+            if feature.agg in ("sum", "mean"):
+                partial[0] += np.bincount(codes, minlength=self.n_customers)
+                partial[1] += np.bincount(codes, weights=values, minlength=self.n_customers)
+            elif feature.agg == "nunique":
+                if not is_datetime:
+                    raise ValueError(f"Feature '{feature.name}': chunked nunique needs a datetime column")
+                first_day = (self.t_ref - pd.Timedelta(days=feature.window_days)).as_unit("ns").value // DAY_NS
+                bits = np.left_shift(np.uint64(1), (values // DAY_NS - first_day).astype(np.uint64))
+                np.bitwise_or.at(partial, codes, bits)
+            else:
+                ufunc = np.maximum if feature.agg == "max" else np.minimum
+                if is_datetime:
+                    fill = np.iinfo(np.int64).min if feature.agg == "max" else np.iinfo(np.int64).max
+                    result = _grouped_reduce(ufunc, codes, values, self.n_customers, fill=fill)
+                    self.partials[feature.name] = result if partial is None else ufunc(partial, result)
+                else:
+                    # fmax / fmin skip the NaN of customers missing from a chunk
+                    fold = np.fmax if feature.agg == "max" else np.fmin
+                    result = _grouped_reduce(ufunc, codes, values.astype(np.float64), self.n_customers)
+                    self.partials[feature.name] = result if partial is None else fold(partial, result)
+
+    def result(self):
+        # Same frame as aggregate_windows over all chunks at once
+        out = {}
+        for feature in self.features:
+            partial = self.partials[feature.name]
+            if feature.agg == "count":
+                out[feature.name] = partial[0]
+            elif feature.agg == "sum":
+                out[feature.name] = partial[1]
+            elif feature.agg == "mean":
+                counts, sums = partial
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[feature.name] = np.where(counts > 0, sums / counts, np.nan)
+            elif feature.agg == "nunique":
+                bytes_ = partial.view(np.uint8).reshape(self.n_customers, 8)
+                out[feature.name] = np.unpackbits(bytes_, axis=1).sum(axis=1).astype(np.int64)
+            elif feature.column in self.datetime_columns:
+                nat = np.iinfo(np.int64).min
+                values = np.where(partial == np.iinfo(np.int64).max, nat, partial)
+                out[feature.name] = pd.to_datetime(values.view("datetime64[ns]"))
+            else:
+                out[feature.name] = np.full(self.n_customers, np.nan) if partial is None else partial
+
+        return pd.DataFrame(out, index=pd.RangeIndex(self.n_customers, name="customer_code"))
+
+
+class PeriodSlopeAccumulator:
+    # period_slope over a table read in chunks: per-period totals are summed
+    # across chunks and the slope is fitted once at the end
+
+    def __init__(self, time_col, t_ref, window_days, n_customers, period_days=7,
+                 value_col=None, where=None, code_col="customer_code"):
+        self.args = (time_col, t_ref, window_days, n_customers, period_days, value_col, where, code_col)
+        self.n_customers = n_customers
+        n_periods = window_days // period_days + 1
+        self.rows = np.zeros(n_customers * n_periods, dtype=np.int64)
+        self.totals = np.zeros(n_customers * n_periods)
+
+    def update(self, chunk):
+        rows, totals = period_totals(chunk, *self.args)
+        self.rows += rows
+        self.totals += totals
+
+    def result(self):
+        return slope_from_periods(self.rows, self.totals, self.n_customers)
@@ -2,101 +2,83 @@
 # BILLING FEATURES
 # -----------------------------
 
-import pandas as pd
 from pathlib import Path
+from core.data.loader import load_table
+from core.data.partitioned import max_time, read_table
+from core.features.aggregation import WindowFeature, aggregate_windows
+from core.features.outputs import write_output
 import numpy as np
 
-RAW_PATH = Path("data/raw")
 PROCESSED_PATH = Path("data/processed")
-PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
-
-customers = pd.read_csv(RAW_PATH / "customers.csv", parse_dates=["signup_date"])
-events = pd.read_csv(RAW_PATH / "usage_events.csv", parse_dates=["timestamp"])
-subscriptions = pd.read_csv(RAW_PATH / "subscriptions.csv", parse_dates=["billing_date"])
-
-# Global reference time
-T_ref = max(
-    events["timestamp"].max(),
-    subscriptions["billing_date"].max()
-)
-
-# Define windows
-window_30d_start = T_ref - pd.Timedelta(days=30)
-window_90d_start = T_ref - pd.Timedelta(days=90)
-
-# Filter paid plans only
-paid_subs = subscriptions[subscriptions["plan_type"] != "free"]
-
-# Successful & failed splits
-success_subs = paid_subs[paid_subs["status"] == "success"]
-failed_subs = paid_subs[paid_subs["status"] == "failed"]
-
-# 1. Successful payments last 90d
-successful_payments_last_90d = (
-    success_subs[success_subs["billing_date"] >= window_90d_start]
-    .groupby("customer_id")
-    .size()
-    .rename("successful_payments_last_90d")
-)
-
-# 2. Failed payments last 30d
-failed_payments_last_30d = (
-    failed_subs[failed_subs["billing_date"] >= window_30d_start]
-    .groupby("customer_id")
-    .size()
-    .rename("failed_payments_last_30d")
-)
-
-# 3. Avg payment amount last 90d (successful only)
-avg_payment_last_90d = (
-    success_subs[success_subs["billing_date"] >= window_90d_start]
-    .groupby("customer_id")["amount"]
-    .mean()
-    .rename("avg_payment_last_90d")
-)
-
-# 4. Days since last successful payment
-last_success_date = (
-    success_subs.groupby("customer_id")["billing_date"]
-    .max()
-)
-
-days_since_last_success_payment = (
-    (T_ref - last_success_date).dt.days
-    .rename("days_since_last_success_payment")
-)
-days_since_last_success_payment = days_since_last_success_payment.replace(np.inf, 999)
-
-# 5. Lifetime revenue (successful only)
-total_revenue_lifetime = (
-    success_subs.groupby("customer_id")["amount"]
-    .sum()
-    .rename("total_revenue_lifetime")
-)
 
-# -----------------------------
-# MERGE
-# -----------------------------
-
-billing_df = customers[["customer_id"]].copy()
-
-for feature in [
-    successful_payments_last_90d,
-    failed_payments_last_30d,
-    avg_payment_last_90d,
-    days_since_last_success_payment,
-    total_revenue_lifetime
-]:
-    billing_df = billing_df.merge(feature, on="customer_id", how="left")
-
-billing_cols = [
-    "successful_payments_last_90d",
-    "failed_payments_last_30d",
-    "avg_payment_last_90d",
-    "days_since_last_success_payment",
-    "total_revenue_lifetime"
+SUCCESS = {"status": "success"}
+FAILED = {"status": "failed"}
+
+BILLING_FEATURES = [
+    # 1. Successful payments last 90d
+    WindowFeature("successful_payments_last_90d", "count", 90, where=SUCCESS),
+    # 2. Failed payments last 30d
+    WindowFeature("failed_payments_last_30d", "count", 30, where=FAILED),
+    # 3. Avg payment amount last 90d (successful only)
+    WindowFeature("avg_payment_last_90d", "mean", 90, column="amount", where=SUCCESS),
+    # 4. Last successful payment (for days since)
+    WindowFeature("last_success_date", "max", column="billing_date", where=SUCCESS),
+    # 5. Lifetime revenue (successful only)
+    WindowFeature("total_revenue_lifetime", "sum", column="amount", where=SUCCESS),
 ]
 
-billing_df[billing_cols] = billing_df[billing_cols].fillna(0)
-billing_df.to_csv(PROCESSED_PATH / "billing_features.csv", index=False)
-print("Billing features built successfully.")
+
+def build_billing_features():
+    customers = load_table("customers")
+    # Lifetime revenue needs the full history, so only columns are pruned
+    subscriptions = read_table("subscriptions", ["billing_date", "amount", "status", "plan_type"])
+
+    # Global reference time
+    T_ref = max(
+        max_time("usage_events"),
+        subscriptions["billing_date"].max()
+    )
+
+    # Filter paid plans only
+    paid_subs = subscriptions[subscriptions["plan_type"] != "free"]
+
+    billing_features = aggregate_windows(paid_subs, "billing_date", T_ref, BILLING_FEATURES, len(customers))
+
+    # 4. Days since last successful payment
+    billing_features["days_since_last_success_payment"] = (
+        (T_ref - billing_features.pop("last_success_date")).dt.days
+    )
+    billing_features["days_since_last_success_payment"] = (
+        billing_features["days_since_last_success_payment"].replace(np.inf, 999)
+    )
+
+    # -----------------------------
+    # MERGE
+    # -----------------------------
+
+    billing_df = customers[["customer_code", "customer_id"]].set_index("customer_code")
+    billing_df = billing_df.join(billing_features)
+
+    billing_cols = [
+        "successful_payments_last_90d",
+        "failed_payments_last_30d",
+        "avg_payment_last_90d",
+        "days_since_last_success_payment",
+        "total_revenue_lifetime"
+    ]
+
+    billing_df = billing_df[["customer_id"] + billing_cols]
+    billing_df[billing_cols] = billing_df[billing_cols].fillna(0)
+
+    return billing_df
+
+
+def main():
+    billing_df = build_billing_features()
+
+    write_output(billing_df, "billing_features", PROCESSED_PATH)
+    print("Billing features built successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,95 @@
+import argparse
 import pandas as pd
 from pathlib import Path
+from core.data.loader import column_max, iter_chunks, load_table
+from core.data.partitioned import max_time, read_table
+from core.data.activity_matrix import ActivityMatrix
+from core.features.aggregation import WindowAccumulator, WindowFeature, aggregate_windows
+from core.features.outputs import write_output
 
-RAW_PATH = Path("data/raw")
 PROCESSED_PATH = Path("data/processed")
-PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
-
-# Loading data
-customers = pd.read_csv(RAW_PATH / "customers.csv", parse_dates=["signup_date"])
-events = pd.read_csv(RAW_PATH / "usage_events.csv", parse_dates=["timestamp"])
-subscriptions = pd.read_csv(RAW_PATH / "subscriptions.csv", parse_dates=["billing_date"])
-
-# Global reference time
-T_ref = max(
-    events["timestamp"].max(),
-    subscriptions["billing_date"].max()
-)
-
-# Define windows
-window_7d_start = T_ref - pd.Timedelta(days=7)
-window_30d_start = T_ref - pd.Timedelta(days=30)
-
-# Filter windows
-events_7d = events[events["timestamp"] >= window_7d_start]
-events_30d = events[events["timestamp"] >= window_30d_start]
-
-# Login features
-logins_last_7d = (
-    events_7d[events_7d["event_type"] == "login"]
-    .groupby("customer_id")
-    .size()
-    .rename("logins_last_7d")
-)
-
-logins_last_30d = (
-    events_30d[events_30d["event_type"] == "login"]
-    .groupby("customer_id")
-    .size()
-    .rename("logins_last_30d")
-)
-
-# Feature usage
-feature_use_last_30d = (
-    events_30d[events_30d["event_type"] == "feature_use"]
-    .groupby("customer_id")
-    .size()
-    .rename("feature_use_last_30d")
-)
-
-# Activity days (distinct calendar days)
-events_30d["event_date"] = events_30d["timestamp"].dt.date
-
-activity_days_last_30d = (
-    events_30d.groupby("customer_id")["event_date"]
-    .nunique()
-    .rename("activity_days_last_30d")
-)
-
-# Merging onto full customer list
-features_df = customers[["customer_id"]].copy()
-
-features_df = features_df.merge(logins_last_7d, on="customer_id", how="left")
-features_df = features_df.merge(logins_last_30d, on="customer_id", how="left")
-features_df = features_df.merge(feature_use_last_30d, on="customer_id", how="left")
-features_df = features_df.merge(activity_days_last_30d, on="customer_id", how="left")
-
-# Filling missing values with 0
-engagement_cols = [
-    "logins_last_7d",
-    "logins_last_30d",
-    "feature_use_last_30d",
-    "activity_days_last_30d"
+
+# Feature definitions
+ENGAGEMENT_FEATURES = [
+    # Login features
+    WindowFeature("logins_last_7d", "count", 7, where={"event_type": "login"}),
+    WindowFeature("logins_last_30d", "count", 30, where={"event_type": "login"}),
+    # Feature usage
+    WindowFeature("feature_use_last_30d", "count", 30, where={"event_type": "feature_use"}),
+    # Activity days (distinct calendar days)
+    WindowFeature("activity_days_last_30d", "nunique", 30, column="timestamp"),
 ]
-features_df[engagement_cols] = features_df[engagement_cols].fillna(0)
 
-features_df.to_csv(PROCESSED_PATH / "engagement_features.csv", index=False)
-print("Engagement features built successfully.")
+
+def build_engagement_features(chunk_rows=None):
+    # With chunk_rows, usage events are streamed in chunks of that many rows
+    # and never loaded whole
+    customers = load_table("customers")
+
+    # Global reference time
+    if chunk_rows:
+        T_ref = max(
+            column_max("usage_events", "timestamp", chunk_rows),
+            column_max("subscriptions", "billing_date", chunk_rows)
+        )
+    else:
+        T_ref = max(
+            max_time("usage_events"),
+            max_time("subscriptions")
+        )
+
+    # The daily activity matrix answers the same windows from prefix sums when it
+    # has been built for the current raw data (python -m core.data.activity_matrix).
+    # Its windows are whole calendar days, which equal the event windows
+    # (timestamp >= T_ref - window) only when T_ref falls on midnight.
+    matrix = ActivityMatrix.open()
+
+    if matrix is not None and T_ref == T_ref.normalize():
+        window_end = T_ref + pd.Timedelta(days=1) # windows include T_ref's own day
+        engagement_features = pd.DataFrame({
+            "logins_last_7d": matrix.window_sum("login", T_ref - pd.Timedelta(days=7), window_end),
+            "logins_last_30d": matrix.window_sum("login", T_ref - pd.Timedelta(days=30), window_end),
+            "feature_use_last_30d": matrix.window_sum("feature_use", T_ref - pd.Timedelta(days=30), window_end),
+            "activity_days_last_30d": matrix.active_days(T_ref - pd.Timedelta(days=30), window_end),
+        }, index=pd.RangeIndex(len(customers), name="customer_code"))
+    elif chunk_rows:
+        accumulator = WindowAccumulator("timestamp", T_ref, ENGAGEMENT_FEATURES, len(customers))
+        for chunk in iter_chunks("usage_events", ["timestamp", "event_type"], chunk_rows):
+            accumulator.update(chunk)
+        engagement_features = accumulator.result()
+    else:
+        # Only the rows inside the longest window, and only the columns used
+        lookback = max(feature.window_days for feature in ENGAGEMENT_FEATURES)
+        events = read_table("usage_events", ["timestamp", "event_type"], start=T_ref - pd.Timedelta(days=lookback))
+        engagement_features = aggregate_windows(events, "timestamp", T_ref, ENGAGEMENT_FEATURES, len(customers))
+
+    # Joining onto full customer list by customer code
+    features_df = customers[["customer_code", "customer_id"]].set_index("customer_code")
+    features_df = features_df.join(engagement_features)
+
+    # Filling missing values with 0
+    engagement_cols = [
+        "logins_last_7d",
+        "logins_last_30d",
+        "feature_use_last_30d",
+        "activity_days_last_30d"
+    ]
+    features_df[engagement_cols] = features_df[engagement_cols].fillna(0)
+
+    return features_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build engagement features.")
+    parser.add_argument("--chunk-rows", type=int, default=None,
+                        help="stream usage events in chunks of this many rows (bounded memory)")
+    args = parser.parse_args()
+
+    features_df = build_engagement_features(args.chunk_rows)
+
+    write_output(features_df, "engagement_features", PROCESSED_PATH)
+    print("Engagement features built successfully.")
+
+
+if __name__ == "__main__":
+    main()
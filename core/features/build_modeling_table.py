@@ -1,33 +1,79 @@
-# Load all features to create thee modeling table:
-# CSVs to load:
-# - engagement_features.csv
-# - billing_features.csv
-# - support_features.csv
-# - trend_features.csv
-# - churn_labels.csv
-
-import pandas as pd
+# Assemble the modeling table:
+# - churn labels (label_churn.py) pick the rows
+# - engagement, billing, support and trend features come from the builders as
+#   frames indexed by customer code over all customers
+#
+# Run on its own, the labels and builders run in process and their frames are
+# joined on the customer code index without being serialized. As a pipeline
+# stage (--from-outputs) the builders have already run as separate stages, or
+# been refreshed by core.features.incremental, and the table joins the typed
+# Parquet files they wrote instead of computing them again. Only a typed
+# Parquet file is written.
+
+import argparse
 from pathlib import Path
+from core.features.label_churn import label_churn
+from core.features.build_engagement_features import build_engagement_features
+from core.features.build_billing_features import build_billing_features
+from core.features.build_ticket_features import build_ticket_features
+from core.features.build_trend_Features import build_trend_features
+from core.features.outputs import read_output, typed
 
 DATA_PATH = 'data/processed'
 
-engagement_features = pd.read_csv(f'{DATA_PATH}/engagement_features.csv')
-billing_features = pd.read_csv(f'{DATA_PATH}/billing_features.csv')
-tickets_features = pd.read_csv(f'{DATA_PATH}/tickets_features.csv')
-trend_features = pd.read_csv(f'{DATA_PATH}/trend_features.csv')
-churn_labels = pd.read_csv(f'{DATA_PATH}/churn_labels.csv')
+# Builders and the output files they write, in the table's column order
+FEATURE_BUILDERS = [
+    build_engagement_features,
+    build_billing_features,
+    build_ticket_features,
+    build_trend_features,
+]
+LABELS = 'churn_labels'
+FEATURE_OUTPUTS = [
+    'engagement_features',
+    'billing_features',
+    'tickets_features',
+    'trend_features',
+]
+
+# Label-side columns the model does not use
+DROPPED_COLUMNS = ['days_since_usage', 'days_since_last_success_payment']
+
+
+def assemble(labels, features):
+    # One row per label row, indexed by customer code like every input frame.
+    # The scoring service builds its feature vectors with this as well.
+    model_df = labels.join([f.drop(columns='customer_id') for f in features])
+
+    feature_cols = [col for col in model_df.columns if col not in ("customer_id", "churn_label")]
+    model_df[feature_cols] = model_df[feature_cols].fillna(0)
+    model_df = model_df.drop(columns=DROPPED_COLUMNS)
+
+    return typed(model_df)
+
+
+def build_modeling_table(from_outputs=False, data_path=DATA_PATH):
+    if from_outputs:
+        labels = read_output(LABELS, data_path)
+        features = [read_output(name, data_path) for name in FEATURE_OUTPUTS]
+    else:
+        labels = label_churn()
+        features = [builder() for builder in FEATURE_BUILDERS]
+    return assemble(labels, features).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the modeling table.")
+    parser.add_argument("--from-outputs", action="store_true",
+                        help="join the builders' Parquet files in data/processed instead of running the builders")
+    args = parser.parse_args()
 
-model_df = churn_labels.copy()
-model_df = model_df.merge(engagement_features, on='customer_id', how='left')
-model_df = model_df.merge(billing_features, on='customer_id', how='left')
-model_df = model_df.merge(tickets_features, on='customer_id', how='left')
-model_df = model_df.merge(trend_features, on='customer_id', how='left')
+    model_df = build_modeling_table(args.from_outputs)
 
-feature_cols = [col for col in model_df.columns if col not in ["customer_id", "churn_label"]]
+    Path(DATA_PATH).mkdir(parents=True, exist_ok=True)
+    model_df.to_parquet(f"{DATA_PATH}/modeling_table.parquet", index=False)
+    print("modeling features built successfully.")
 
-model_df[feature_cols] = model_df[feature_cols].fillna(0)
-model_df.drop(columns=['days_since_usage', 'days_since_last_success_payment'], inplace=True)
 
-model_df.to_parquet(f"{DATA_PATH}/modeling_table.parquet", index=False)
-model_df.to_csv(f"{DATA_PATH}/modeling_table.csv", index=False)
-print("modeling features built successfully.")
+if __name__ == "__main__":
+    main()
@@ -4,54 +4,60 @@
 
 import pandas as pd
 from pathlib import Path
+from core.data.loader import load_table
+from core.data.partitioned import max_time, read_table
+from core.features.aggregation import WindowFeature, aggregate_windows
+from core.features.outputs import write_output
 
-RAW_PATH = Path("data/raw")
 PROCESSED_PATH = Path("data/processed")
-PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
-
-customers = pd.read_csv(RAW_PATH / "customers.csv", parse_dates=["signup_date"])
-events = pd.read_csv(RAW_PATH / "usage_events.csv", parse_dates=["timestamp"])
-subscriptions = pd.read_csv(RAW_PATH / "subscriptions.csv", parse_dates=["billing_date"])
-tickets = pd.read_csv(RAW_PATH / "support_tickets.csv", parse_dates=["ticket_date"])
-
-# Global reference time
-T_ref = max(
-    events["timestamp"].max(),
-    subscriptions["billing_date"].max(),
-    tickets['ticket_date'].max()
-)
-
-# Define windows
-window_30d_start = T_ref - pd.Timedelta(days=30)
-window_90d_start = T_ref - pd.Timedelta(days=90)
-
-# Filter windows
-tickets_30d = tickets[tickets["ticket_date"] >= window_30d_start].groupby('customer_id')
-tickets_90d = tickets[tickets["ticket_date"] >= window_90d_start].groupby('customer_id')
-
-tickets_last_30d = tickets_30d.size().rename('tickets_last_30d')
-tickets_last_90d = tickets_90d.size().rename('tickets_last_90d')
-
-avg_resolution_count = tickets_90d['resolution_hours'].size()
-avg_resolution_hours = tickets_90d['resolution_hours'].sum()
-avg_resolution_time_90d = avg_resolution_hours/avg_resolution_count
-avg_resolution_time_90d = avg_resolution_time_90d.rename('avg_resolution_time_90d')
-
-billing_tickets_90d = tickets[(tickets["ticket_date"] >= window_90d_start) & (tickets["issue_type"] == "billing")]
-billing_related_tickets_90d = billing_tickets_90d.groupby("customer_id").size().rename("billing_related_tickets_90d")
-
-features_df = customers[["customer_id"]].copy()
-
-for feature in [tickets_last_30d, tickets_last_90d, avg_resolution_time_90d, billing_related_tickets_90d]:
-    features_df = features_df.merge(feature, on="customer_id", how="left")
-    
-tickets_cols = [
-    'tickets_last_30d',
-    'tickets_last_90d',
-    'avg_resolution_time_90d',
-    'billing_related_tickets_90d'
+
+TICKET_FEATURES = [
+    WindowFeature("tickets_last_30d", "count", 30),
+    WindowFeature("tickets_last_90d", "count", 90),
+    WindowFeature("avg_resolution_time_90d", "mean", 90, column="resolution_hours"),
+    WindowFeature("billing_related_tickets_90d", "count", 90, where={"issue_type": "billing"}),
 ]
-features_df[tickets_cols] = features_df[tickets_cols].fillna(0)
 
-features_df.to_csv(PROCESSED_PATH / "tickets_features.csv", index=False)
-print("tickets features built successfully.")
\ No newline at end of file
+
+def build_ticket_features():
+    customers = load_table("customers")
+
+    # Global reference time
+    T_ref = max(
+        max_time("usage_events"),
+        max_time("subscriptions"),
+        max_time("support_tickets")
+    )
+
+    lookback = max(feature.window_days for feature in TICKET_FEATURES)
+    tickets = read_table(
+        "support_tickets", ["ticket_date", "resolution_hours", "issue_type"],
+        start=T_ref - pd.Timedelta(days=lookback)
+    )
+
+    tickets_features = aggregate_windows(tickets, "ticket_date", T_ref, TICKET_FEATURES, len(customers))
+
+    features_df = customers[["customer_code", "customer_id"]].set_index("customer_code")
+
+    features_df = features_df.join(tickets_features)
+
+    tickets_cols = [
+        'tickets_last_30d',
+        'tickets_last_90d',
+        'avg_resolution_time_90d',
+        'billing_related_tickets_90d'
+    ]
+    features_df[tickets_cols] = features_df[tickets_cols].fillna(0)
+
+    return features_df
+
+
+def main():
+    features_df = build_ticket_features()
+
+    write_output(features_df, "tickets_features", PROCESSED_PATH)
+    print("tickets features built successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,106 @@
 # -----------------------------
-# ENGAGEMENT DECAY SLOPE & FEATURES
+# ENGAGEMENT DECAY SLOPE & TREND FEATURES
 # -----------------------------
 
+import argparse
 import pandas as pd
 from pathlib import Path
-import numpy as np
+from core.data.loader import column_max, iter_chunks, load_table
+from core.data.partitioned import max_time, read_table
+from core.features.aggregation import PeriodSlopeAccumulator, period_slope
+from core.features.outputs import write_output
 
-RAW_PATH = Path("data/raw")
 PROCESSED_PATH = Path("data/processed")
-PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
-
-customers = pd.read_csv(RAW_PATH / "customers.csv", parse_dates=["signup_date"])
-events = pd.read_csv(RAW_PATH / "usage_events.csv", parse_dates=["timestamp"])
-subscriptions = pd.read_csv(RAW_PATH / "subscriptions.csv", parse_dates=["billing_date"])
-tickets = pd.read_csv(RAW_PATH / "support_tickets.csv", parse_dates=["ticket_date"])
-
-# Global reference time
-T_ref = max(
-    events["timestamp"].max(),
-    subscriptions["billing_date"].max(),
-    tickets['ticket_date'].max()
-)
-
-# Define windows
-window_30d_start = T_ref - pd.Timedelta(days=30)
-window_56d_start = T_ref - pd.Timedelta(days=56)
-window_90d_start = T_ref - pd.Timedelta(days=90)
-
-recent_events = events[
-    (events["timestamp"] >= window_56d_start) &
-    (events["event_type"] == "login")
-].copy()
-
-recent_events["week_index"] = (
-    (T_ref - recent_events["timestamp"]).dt.days // 7
-)
-
-weekly_counts = (
-    recent_events.groupby(["customer_id", "week_index"])
-    .size()
-    .reset_index(name="login_count")
-)
-
-def compute_slope(df_group):
-    if df_group.shape[0] < 2:
-        return 0.0
-
-    x = df_group["week_index"].values
-    y = df_group["login_count"].values
-
-    x_mean = x.mean()
-    y_mean = y.mean()
-
-    numerator = ((x - x_mean) * (y - y_mean)).sum()
-    denominator = ((x - x_mean) ** 2).sum()
-
-    if denominator == 0:
-        return 0.0
-
-    return numerator / denominator
-
-engagement_decay = (
-    weekly_counts.groupby("customer_id")
-    .apply(compute_slope)
-    .rename("engagement_decay_slope")
-    .reset_index()
-)
-
-trend_df = customers[["customer_id"]].merge(
-    engagement_decay,
-    on="customer_id",
-    how="left"
-)
-
-trend_df["engagement_decay_slope"] = trend_df["engagement_decay_slope"].fillna(0)
-trend_df.to_csv(PROCESSED_PATH / "trend_features.csv", index=False)
-print("Trend feature built successfully.")
+
+
+def with_collected_amount(subscriptions):
+    # Amount actually collected per billing row; failed payments collect nothing
+    return subscriptions.assign(
+        collected_amount=subscriptions["amount"].where(subscriptions["status"] == "success", 0)
+    )
+
+
+def build_trend_features(chunk_rows=None):
+    # With chunk_rows, usage events and subscriptions are streamed in chunks of
+    # that many rows and never loaded whole
+    customers = load_table("customers")
+
+    # Global reference time
+    if chunk_rows:
+        T_ref = max(
+            column_max("usage_events", "timestamp", chunk_rows),
+            column_max("subscriptions", "billing_date", chunk_rows),
+            column_max("support_tickets", "ticket_date", chunk_rows)
+        )
+    else:
+        T_ref = max(
+            max_time("usage_events"),
+            max_time("subscriptions"),
+            max_time("support_tickets")
+        )
+
+    n_customers = len(customers)
+
+    # Weekly login / feature_use counts over the last 8 weeks, and the amount
+    # collected per 30-day billing period over the last 6 months (failed
+    # payments are points with nothing collected)
+    login_args = ("timestamp", T_ref, 56, n_customers)
+    login_where = {"event_type": "login"}
+    feature_use_where = {"event_type": "feature_use"}
+    billing_args = ("billing_date", T_ref, 180, n_customers)
+    billing_kwargs = {"period_days": 30, "value_col": "collected_amount"}
+
+    if chunk_rows:
+        engagement_decay = PeriodSlopeAccumulator(*login_args, where=login_where)
+        feature_use_decay = PeriodSlopeAccumulator(*login_args, where=feature_use_where)
+        for chunk in iter_chunks("usage_events", ["timestamp", "event_type"], chunk_rows):
+            engagement_decay.update(chunk)
+            feature_use_decay.update(chunk)
+
+        billing_amount_trend = PeriodSlopeAccumulator(*billing_args, **billing_kwargs)
+        for chunk in iter_chunks("subscriptions", ["billing_date", "amount", "status"], chunk_rows):
+            billing_amount_trend.update(with_collected_amount(chunk))
+
+        engagement_decay = engagement_decay.result()
+        feature_use_decay = feature_use_decay.result()
+        billing_amount_trend = billing_amount_trend.result()
+    else:
+        # Only the rows inside each trend window, and only the columns used
+        events = read_table(
+            "usage_events", ["timestamp", "event_type"],
+            start=T_ref - pd.Timedelta(days=56), where={"event_type": ["login", "feature_use"]}
+        )
+        subscriptions = read_table(
+            "subscriptions", ["billing_date", "amount", "status"], start=T_ref - pd.Timedelta(days=180)
+        )
+        engagement_decay = period_slope(events, *login_args, where=login_where)
+        feature_use_decay = period_slope(events, *login_args, where=feature_use_where)
+        billing_amount_trend = period_slope(with_collected_amount(subscriptions), *billing_args, **billing_kwargs)
+
+    trend_df = customers[["customer_code", "customer_id"]].set_index("customer_code")
+    trend_df = trend_df.join([
+        engagement_decay.rename("engagement_decay_slope"),
+        feature_use_decay.rename("feature_use_decay_slope"),
+        billing_amount_trend.rename("billing_amount_slope"),
+    ])
+
+    trend_cols = ["engagement_decay_slope", "feature_use_decay_slope", "billing_amount_slope"]
+    trend_df[trend_cols] = trend_df[trend_cols].fillna(0)
+
+    return trend_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build trend features.")
+    parser.add_argument("--chunk-rows", type=int, default=None,
+                        help="stream events and subscriptions in chunks of this many rows (bounded memory)")
+    args = parser.parse_args()
+
+    trend_df = build_trend_features(args.chunk_rows)
+
+    write_output(trend_df, "trend_features", PROCESSED_PATH)
+    print("Trend feature built successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,214 @@
-# Loading the modeling_features.parquet
-
+# Feature correlation and redundancy analysis on the modeling table
+#
+# Headless: results are written to data/processed/feature_analysis instead of
+# being plotted. The features are read as one float32 matrix (read_matrix) and
+# correlated with a single matrix product; only the upper triangle is ranked,
+# with argpartition, for the top-k positive / negative / absolute pairs. Each
+# feature's correlation with churn_label is reported next to its per-label
+# means (label_mean_difference.csv).
+#
+# For large tables the matrix can be a stratified sample drawn while reading
+# (--sample-rows, class shares of churn_label kept), or the statistics can be
+# accumulated over Parquet row batches in parallel without holding the table
+# (--streaming, see statistics.FeatureStatistics).
+#
+#   python -m core.features.correlation --top-k 20
+#   python -m core.features.correlation --streaming --batch-rows 1000000
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import pyarrow.parquet as pq
+
+from core.data.training_matrix import NON_FEATURES, read_matrix
+from core.features.statistics import compute_statistics
 
 DATA_PATH = 'data/processed'
-modeling_df = pd.read_parquet(f'{DATA_PATH}/modeling_table.parquet')
-
-modeling_df_numeric = modeling_df.select_dtypes('number')
-
-corr = modeling_df_numeric.corr()
-
-# corr = numeric_df.corr()["churn_label"].drop("churn_label")
-
-corr_pairs = (
-    corr.unstack()                                # (col_a, col_b) -> correlation
-        .dropna()                                 # drop NaNs
-        .reset_index()                            # turn into a DataFrame
-        .rename(columns={'level_0': 'var1', 'level_1': 'var2', 0: 'corr'})
-)
-
-# Removing self-correlations (where var1 == var2)
-corr_pairs = corr_pairs[corr_pairs['var1'] != corr_pairs['var2']]
-
-# To avoid duplicate pairs (A,B) and (B,A), keeping only one ordering
-# For example, keep where var1 < var2 lexicographically
-corr_pairs = corr_pairs.assign(pair_min=lambda d: d[['var1','var2']].min(axis=1),
-                               pair_max=lambda d: d[['var1','var2']].max(axis=1))
-corr_pairs = corr_pairs.drop_duplicates(subset=['pair_min','pair_max'])
-corr_pairs = corr_pairs.drop(columns=['pair_min','pair_max'])
-
-# Top 10 positive and top 10 negative correlations
-top_positive = (
-    corr_pairs[corr_pairs['corr'] > 0]
-    .sort_values(by='corr', ascending=False)
-    .head(10)
-)
-
-top_negative = (
-    corr_pairs[corr_pairs['corr'] < 0]
-    .sort_values(by='corr')
-    .head(10)
-)
-
-pos = corr.where(corr > 0)
-neg = corr.where(corr < 0)
-plt.figure(figsize=(10, 8))
-sns.heatmap(pos, annot=True, fmt=".2f", cmap="Blues", center=0)
-sns.heatmap(neg, annot=True, fmt=".2f", cmap="Reds_r", center=0)
-plt.title("Positive & Negative Correlations")
-plt.tight_layout()
-plt.show()
-
-
-# Mean around:
-# - Churn label 1
-# - Churn label 0
-
-# mean per group
-group_means = modeling_df.groupby("churn_label").mean(numeric_only=True)
-
-# Difference between churn=1 & churn=0
-difference = group_means.loc[1] - group_means.loc[0]
-difference = difference.drop("churn_label", errors="ignore")
-
-# Sorting by magnitude (Optional)
-difference = difference.sort_values(ascending=False)
-print(difference)
\ No newline at end of file
+OUTPUT_PATH = Path(f'{DATA_PATH}/feature_analysis')
+TOP_K = 10
+BATCH_ROWS = 1_000_000
+HEATMAP_MAX_FEATURES = 60  # feature labels are unreadable beyond this
+
+
+def stratified_sample(y, n_rows, seed=42):
+    # Row indices of a sample of about n_rows that keeps each label's share
+    if n_rows >= len(y):
+        return np.arange(len(y))
+    rng = np.random.default_rng(seed)
+    rows = []
+    for label in np.unique(y):
+        members = np.flatnonzero(y == label)
+        size = max(1, round(n_rows * len(members) / len(y)))
+        rows.append(rng.choice(members, size=min(size, len(members)), replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+def correlation_from_covariance(cov):
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.outer(std, std)
+    # Constant features have no correlation
+    corr[:, std == 0] = np.nan
+    corr[std == 0, :] = np.nan
+    return np.clip(corr, -1, 1)
+
+
+def read_sample(path, sample_rows, seed=42):
+    # (X, y, feature names) of a stratified sample, read without loading the
+    # table: rows are drawn from the label column alone, then each row group
+    # is read one at a time and only its sampled rows are taken into X
+    parquet = pq.ParquetFile(path)
+    feature_names = [c for c in parquet.schema_arrow.names if c not in NON_FEATURES and c != 'churn_label']
+    labels = parquet.read(columns=['churn_label']).column('churn_label').to_numpy()
+    rows = stratified_sample(labels, sample_rows, seed)
+
+    X = np.empty((len(rows), len(feature_names)), dtype=np.float32)
+    group_starts = np.cumsum([0] + [parquet.metadata.row_group(g).num_rows for g in range(parquet.num_row_groups)])
+    bounds = np.searchsorted(rows, group_starts)
+    for g in range(parquet.num_row_groups):
+        lo, hi = bounds[g], bounds[g + 1]
+        if lo == hi:
+            continue
+        group = parquet.read_row_group(g, columns=feature_names).take(rows[lo:hi] - group_starts[g])
+        for j, name in enumerate(feature_names):
+            X[lo:hi, j] = group.column(name).to_numpy(zero_copy_only=False)
+    return X, labels[rows].astype(np.int32), feature_names
+
+
+def in_memory_analysis(path, sample_rows=None, seed=42):
+    # (corr, per-label feature means, correlation with the label, feature names,
+    # rows used). The matrix is centred in place and multiplied in float32: no
+    # float64 copy of the table.
+    if sample_rows:
+        X, y, feature_names = read_sample(path, sample_rows, seed)
+    else:
+        X, y, feature_names, _ = read_matrix(path)
+
+    label_means = {label: X[y == label].mean(axis=0, dtype=np.float64) for label in np.unique(y)}
+    X -= X.mean(axis=0, dtype=np.float64).astype(np.float32)
+    cov = (X.T @ X).astype(np.float64) / (len(X) - 1)
+
+    # The label's column of the same centred product
+    y_centred = (y - y.mean()).astype(np.float32)
+    label_cov = (X.T @ y_centred).astype(np.float64) / (len(X) - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        label_corr = label_cov / (np.sqrt(np.diag(cov)) * y.std(ddof=1))
+    return correlation_from_covariance(cov), label_means, np.clip(label_corr, -1, 1), feature_names, len(y)
+
+
+def point_biserial(stats):
+    # Correlation of each feature with a 0/1 label from the per-label counts
+    # and means - equal to the Pearson correlation, without a cross-product
+    if set(stats.label_n) != {0, 1}:
+        return np.full(len(stats.feature_names), np.nan)
+    n1, n0 = stats.label_n[1], stats.label_n[0]
+    n = n1 + n0
+    means = stats.label_means()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (means[1] - means[0]) / np.sqrt(stats.variance()) * np.sqrt(n1 * n0 / (n * (n - 1)))
+    return np.clip(corr, -1, 1)
+
+
+def streaming_analysis(path, batch_rows=BATCH_ROWS, workers=None):
+    # Same result as in_memory_analysis over the full table, from mergeable
+    # statistics accumulated over the Parquet row groups in parallel
+    stats = compute_statistics(path, workers=workers, batch_rows=batch_rows)
+    return stats.correlation(), stats.label_means(), point_biserial(stats), stats.feature_names, stats.rows
+
+
+def top_pairs(corr, feature_names, k=TOP_K):
+    # Top-k positive, negative and absolute correlations from the upper
+    # triangle (each unordered pair once, no self-correlations)
+    i, j = np.triu_indices(len(feature_names), k=1)
+    values = corr[i, j]
+    known = ~np.isnan(values)
+    i, j, values = i[known], j[known], values[known]
+    names = np.asarray(feature_names)
+
+    def top(selected, scores, kind):
+        candidates = np.flatnonzero(selected)
+        n = min(k, len(candidates))
+        # argpartition finds the k best in linear time; only those are sorted
+        best = candidates[np.argpartition(-scores[candidates], n - 1)[:n]] if n else candidates
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return pd.DataFrame({'kind': kind, 'var1': names[i[best]], 'var2': names[j[best]], 'corr': values[best]})
+
+    return pd.concat([
+        top(values > 0, values, 'positive'),
+        top(values < 0, -values, 'negative'),
+        top(np.ones(len(values), dtype=bool), np.abs(values), 'absolute'),
+    ], ignore_index=True)
+
+
+def label_mean_difference(label_means, label_corr, feature_names):
+    # Mean of each feature for churned minus non-churned customers, and its
+    # correlation with churn_label
+    columns = {f'mean_churn_{label}': means for label, means in sorted(label_means.items())}
+    df = pd.DataFrame(columns, index=pd.Index(feature_names, name='feature'))
+    df['corr_churn_label'] = label_corr
+    if {0, 1} <= set(label_means):
+        df['difference'] = label_means[1] - label_means[0]
+        df = df.sort_values('difference', ascending=False)
+    return df
+
+
+def save_heatmap(corr, feature_names, path):
+    # Imported here: the analysis itself does not need a plotting stack
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    size = max(6, len(feature_names) * 0.35)
+    fig, ax = plt.subplots(figsize=(size * 1.2, size))
+    image = ax.imshow(corr, cmap='RdBu_r', vmin=-1, vmax=1)
+    ax.set_xticks(range(len(feature_names)), feature_names, rotation=90, fontsize=7)
+    ax.set_yticks(range(len(feature_names)), feature_names, fontsize=7)
+    fig.colorbar(image, ax=ax, fraction=0.046)
+    ax.set_title('Feature correlations')
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Correlation and redundancy analysis of the modeling table.')
+    parser.add_argument('--input', default=f'{DATA_PATH}/modeling_table.parquet')
+    parser.add_argument('--output', default=OUTPUT_PATH, type=Path)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--sample-rows', type=int, default=None, help='correlate a stratified sample of this many rows')
+    parser.add_argument('--streaming', action='store_true', help='accumulate the covariance over Parquet batches')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    parser.add_argument('--workers', type=int, default=None, help='processes for --streaming (default: all cores)')
+    parser.add_argument('--heatmap', action='store_true',
+                        help=f'also write correlation_heatmap.png (up to {HEATMAP_MAX_FEATURES} features)')
+    args = parser.parse_args()
+
+    if args.streaming:
+        corr, label_means, label_corr, feature_names, n_rows = streaming_analysis(
+            args.input, args.batch_rows, args.workers
+        )
+    else:
+        corr, label_means, label_corr, feature_names, n_rows = in_memory_analysis(args.input, args.sample_rows)
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    pairs = top_pairs(corr, feature_names, args.top_k)
+    pairs.to_csv(args.output / 'top_correlation_pairs.csv', index=False)
+    label_summary = label_mean_difference(label_means, label_corr, feature_names)
+    label_summary.to_csv(args.output / 'label_mean_difference.csv')
+    np.save(args.output / 'correlation_matrix.npy', corr.astype(np.float32))
+    with open(args.output / 'feature_names.json', 'w') as f:
+        json.dump({'features': feature_names, 'rows': int(n_rows)}, f, indent=2)
+
+    if args.heatmap and len(feature_names) <= HEATMAP_MAX_FEATURES:
+        save_heatmap(corr, feature_names, args.output / 'correlation_heatmap.png')
+
+    print(f"Correlation analysis of {len(feature_names)} features over {n_rows} rows written to {args.output}")
+    print(pairs[pairs['kind'] == 'absolute'].to_string(index=False))
+    print('\nCorrelation with churn_label:')
+    print(label_summary['corr_churn_label'].sort_values(key=np.abs, ascending=False).head(args.top_k).to_string())
+
+
+if __name__ == '__main__':
+    main()
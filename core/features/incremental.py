@@ -0,0 +1,430 @@
+# Incremental daily feature refresh
+#
+# Keeps a persisted store of per-customer daily rollups (one Parquet file per
+# day under data/processed/rollups) and a per-customer lifetime state file. A
+# daily refresh rolls up only the new day's raw rows, folds them into the state
+# and re-derives the feature and label files from the last MAX_WINDOW_DAYS of
+# rollups, so it costs O(new rows + customers) instead of O(full history). The
+# files are the builders' outputs (core.features.outputs), and the modeling
+# table is re-joined from them at the end of each run.
+#
+# Each output uses its builder's reference date: labels, engagement and billing
+# the latest usage event or billing row, tickets and trend the latest row of
+# any table. --check compares the derived outputs with the full builders run
+# on data/raw (values and dtypes) and fails on any difference.
+#
+# First build the store from the full raw history, then refresh daily:
+#   python -m core.features.incremental --rebuild --check
+#   python -m core.features.incremental --date 2026-01-01 --events events.csv \
+#       --subscriptions subscriptions.csv --tickets tickets.csv
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from core.data.loader import load_table, load_tables, customer_index
+from core.features.aggregation import WindowFeature, aggregate_windows, period_slope
+from core.features.build_billing_features import build_billing_features
+from core.features.build_engagement_features import build_engagement_features
+from core.features.build_modeling_table import build_modeling_table
+from core.features.build_ticket_features import build_ticket_features
+from core.features.build_trend_Features import build_trend_features
+from core.features.label_churn import label_churn
+from core.features.outputs import typed, write_output
+
+PROCESSED_PATH = Path("data/processed")
+ROLLUP_PATH = PROCESSED_PATH / "rollups"
+STATE_FILE = "state.parquet"
+
+MAX_INACTIVITY_DAYS = 45
+MAX_WINDOW_DAYS = 180 # longest window any derived feature needs
+
+ROLLUP_COLUMNS = [
+    "logins",
+    "feature_use",
+    "paid_payments",      # successful payments on paid plans
+    "paid_amount",
+    "failed_payments",    # failed payments on paid plans
+    "success_payments",   # successful payments on any plan
+    "billing_attempts",
+    "collected_amount",
+    "tickets",
+    "billing_tickets",
+    "resolution_hours",
+]
+
+STATE_DATE_COLUMNS = ["last_usage_date", "last_success_payment_date", "last_paid_success_date"]
+
+# -----------------------------
+# ROLLUPS
+# -----------------------------
+def daily_rollup(events=None, subscriptions=None, tickets=None):
+    # One row per (customer_code, day) with the day's counts and sums
+    index = customer_index()
+    parts = []
+
+    def codes(df):
+        if "customer_code" in df.columns:
+            return df["customer_code"].to_numpy()
+        return index.encode(df["customer_id"])
+
+    if events is not None and len(events):
+        is_login = (events["event_type"] == "login").to_numpy()
+        parts.append(pd.DataFrame({
+            "customer_code": codes(events),
+            "day": pd.to_datetime(events["timestamp"]).dt.floor("D").to_numpy(),
+            "logins": is_login.astype(np.int64),
+            "feature_use": (events["event_type"] == "feature_use").to_numpy().astype(np.int64),
+        }))
+
+    if subscriptions is not None and len(subscriptions):
+        success = (subscriptions["status"] == "success").to_numpy()
+        paid = (subscriptions["plan_type"] != "free").to_numpy()
+        amount = subscriptions["amount"].to_numpy().astype(np.float64)
+        parts.append(pd.DataFrame({
+            "customer_code": codes(subscriptions),
+            "day": pd.to_datetime(subscriptions["billing_date"]).dt.floor("D").to_numpy(),
+            "paid_payments": (paid & success).astype(np.int64),
+            "paid_amount": np.where(paid & success, amount, 0),
+            "failed_payments": (paid & ~success).astype(np.int64),
+            "success_payments": success.astype(np.int64),
+            "billing_attempts": 1,
+            "collected_amount": np.where(success, amount, 0),
+        }))
+
+    if tickets is not None and len(tickets):
+        parts.append(pd.DataFrame({
+            "customer_code": codes(tickets),
+            "day": pd.to_datetime(tickets["ticket_date"]).dt.floor("D").to_numpy(),
+            "tickets": 1,
+            "billing_tickets": (tickets["issue_type"] == "billing").to_numpy().astype(np.int64),
+            "resolution_hours": tickets["resolution_hours"].to_numpy().astype(np.float64),
+        }))
+
+    if not parts:
+        return pd.DataFrame(columns=["customer_code", "day"] + ROLLUP_COLUMNS)
+
+    rollup = pd.concat(parts, ignore_index=True)
+    rollup = rollup[rollup["customer_code"] >= 0]
+    rollup = rollup.reindex(columns=["customer_code", "day"] + ROLLUP_COLUMNS).fillna(0)
+    return rollup.groupby(["customer_code", "day"], as_index=False).sum()
+
+
+def rollup_file(day, rollup_path=ROLLUP_PATH):
+    return Path(rollup_path) / f"{day:%Y-%m-%d}.parquet"
+
+
+def write_rollups(rollup, rollup_path=ROLLUP_PATH):
+    # The store is keyed by customer_id, so it survives changes to customer codes
+    index = customer_index()
+    rollup_path = Path(rollup_path)
+    rollup_path.mkdir(parents=True, exist_ok=True)
+
+    for day, day_rollup in rollup.groupby("day"):
+        path = rollup_file(day, rollup_path)
+        day_rollup = day_rollup.drop(columns=["day"])
+        if path.exists():
+            # Late rows for a day already in the store are added to it
+            existing = read_rollup_file(path)
+            day_rollup = pd.concat([existing.drop(columns=["day"]), day_rollup])
+            day_rollup = day_rollup.groupby("customer_code", as_index=False).sum()
+
+        out = day_rollup.drop(columns=["customer_code"])
+        out.insert(0, "customer_id", index.decode(day_rollup["customer_code"]))
+        out.to_parquet(path, index=False)
+
+
+def read_rollup_file(path):
+    df = pd.read_parquet(path)
+    df.insert(0, "customer_code", customer_index().encode(df.pop("customer_id")))
+    df.insert(1, "day", pd.Timestamp(path.stem))
+    return df[df["customer_code"] >= 0]
+
+
+def read_rollups(start, end, rollup_path=ROLLUP_PATH):
+    # Only the day files inside [start, end] are opened
+    paths = [
+        path for path in sorted(Path(rollup_path).glob("????-??-??.parquet"))
+        if start <= pd.Timestamp(path.stem) <= end
+    ]
+    if not paths:
+        return pd.DataFrame(columns=["customer_code", "day"] + ROLLUP_COLUMNS)
+    return pd.concat([read_rollup_file(path) for path in paths], ignore_index=True)
+
+# -----------------------------
+# LIFETIME STATE
+# -----------------------------
+def update_state(state, rollup):
+    # Folds new daily rollups into the per-customer lifetime state
+    rollup = rollup.assign(
+        usage_day=rollup["day"].where(rollup["logins"] + rollup["feature_use"] > 0),
+        success_day=rollup["day"].where(rollup["success_payments"] > 0),
+        paid_success_day=rollup["day"].where(rollup["paid_payments"] > 0),
+    )
+    new = rollup.groupby("customer_code").agg(
+        total_revenue_lifetime=("paid_amount", "sum"),
+        last_usage_date=("usage_day", "max"),
+        last_success_payment_date=("success_day", "max"),
+        last_paid_success_date=("paid_success_day", "max"),
+    )
+    if state is None or state.empty:
+        return new
+
+    combined = state.reindex(state.index.union(new.index))
+    new = new.reindex(combined.index)
+    combined["total_revenue_lifetime"] = combined["total_revenue_lifetime"].fillna(0) + new["total_revenue_lifetime"].fillna(0)
+    for col in STATE_DATE_COLUMNS:
+        combined[col] = pd.concat([combined[col], new[col]], axis=1).max(axis=1)
+    return combined
+
+
+def read_state(rollup_path=ROLLUP_PATH):
+    path = Path(rollup_path) / STATE_FILE
+    if not path.exists():
+        return None
+    state = pd.read_parquet(path)
+    state.index = pd.Index(customer_index().encode(state.pop("customer_id")), name="customer_code")
+    return state[state.index >= 0]
+
+
+def write_state(state, rollup_path=ROLLUP_PATH):
+    out = state.reset_index(drop=True)
+    out.insert(0, "customer_id", customer_index().decode(state.index))
+    out.to_parquet(Path(rollup_path) / STATE_FILE, index=False)
+
+# -----------------------------
+# DERIVED FEATURES
+# -----------------------------
+ENGAGEMENT_FEATURES = [
+    WindowFeature("logins_last_7d", "sum", 7, column="logins"),
+    WindowFeature("logins_last_30d", "sum", 30, column="logins"),
+    WindowFeature("feature_use_last_30d", "sum", 30, column="feature_use"),
+    WindowFeature("activity_days_last_30d", "sum", 30, column="active"),
+]
+
+BILLING_FEATURES = [
+    WindowFeature("successful_payments_last_90d", "sum", 90, column="paid_payments"),
+    WindowFeature("failed_payments_last_30d", "sum", 30, column="failed_payments"),
+    WindowFeature("paid_amount_last_90d", "sum", 90, column="paid_amount"),
+]
+
+TICKET_FEATURES = [
+    WindowFeature("tickets_last_30d", "sum", 30, column="tickets"),
+    WindowFeature("tickets_last_90d", "sum", 90, column="tickets"),
+    WindowFeature("resolution_hours_90d", "sum", 90, column="resolution_hours"),
+    WindowFeature("billing_related_tickets_90d", "sum", 90, column="billing_tickets"),
+]
+
+
+# Count columns: whole numbers in the builders' outputs, restored after the
+# joins' NaN fill turned them into floats
+COUNT_COLUMNS = {
+    "engagement_features": [f.name for f in ENGAGEMENT_FEATURES],
+    "billing_features": ["successful_payments_last_90d", "failed_payments_last_30d"],
+    "tickets_features": ["tickets_last_30d", "tickets_last_90d", "billing_related_tickets_90d"],
+}
+
+# The full builders each output is checked against
+BUILDERS = {
+    "churn_labels": label_churn,
+    "engagement_features": build_engagement_features,
+    "billing_features": build_billing_features,
+    "tickets_features": build_ticket_features,
+    "trend_features": build_trend_features,
+}
+
+
+def days_since(T_ref, dates):
+    return (T_ref - dates).dt.days
+
+
+def reference_dates(rollup, day):
+    # (usage / billing reference date, all-tables reference date) as the
+    # builders take them from the raw tables: the latest day with rows of
+    # those tables up to day (raw dates are whole days)
+    def latest(*columns):
+        days = rollup.loc[(rollup[list(columns)] > 0).any(axis=1), "day"]
+        return days.max() if len(days) else pd.NaT
+
+    usage_billing = pd.Series([latest("logins", "feature_use"), latest("billing_attempts")]).max()
+    every_table = pd.Series([usage_billing, latest("tickets")]).max()
+    return (
+        day if pd.isna(usage_billing) else usage_billing,
+        day if pd.isna(every_table) else every_table,
+    )
+
+
+def derive_outputs(day, customers, state, rollup_path=ROLLUP_PATH):
+    # Rebuilds the builders' output files from the rollup window and the state
+    n = len(customers)
+    rollup = read_rollups(day - pd.Timedelta(days=MAX_WINDOW_DAYS), day, rollup_path)
+    rollup["active"] = ((rollup["logins"] + rollup["feature_use"]) > 0).astype(np.int64)
+    state = state.reindex(pd.RangeIndex(n, name="customer_code"))
+    base = customers[["customer_code", "customer_id"]].set_index("customer_code")
+    T_ref, T_all = reference_dates(rollup, day)
+
+    engagement = base.join(aggregate_windows(rollup, "day", T_ref, ENGAGEMENT_FEATURES, n)).fillna(0)
+
+    billing = aggregate_windows(rollup, "day", T_ref, BILLING_FEATURES, n)
+    billing["avg_payment_last_90d"] = billing.pop("paid_amount_last_90d") / billing["successful_payments_last_90d"]
+    billing["days_since_last_success_payment"] = days_since(T_ref, state["last_paid_success_date"])
+    billing["total_revenue_lifetime"] = state["total_revenue_lifetime"]
+    billing = base.join(billing[[
+        "successful_payments_last_90d",
+        "failed_payments_last_30d",
+        "avg_payment_last_90d",
+        "days_since_last_success_payment",
+        "total_revenue_lifetime",
+    ]]).fillna(0)
+
+    tickets = aggregate_windows(rollup, "day", T_all, TICKET_FEATURES, n)
+    tickets["avg_resolution_time_90d"] = tickets.pop("resolution_hours_90d") / tickets["tickets_last_90d"]
+    tickets = base.join(tickets[[
+        "tickets_last_30d",
+        "tickets_last_90d",
+        "avg_resolution_time_90d",
+        "billing_related_tickets_90d",
+    ]]).fillna(0)
+
+    trend = base.join([
+        period_slope(rollup[rollup["logins"] > 0], "day", T_all, 56, n, value_col="logins")
+        .rename("engagement_decay_slope"),
+        period_slope(rollup[rollup["feature_use"] > 0], "day", T_all, 56, n, value_col="feature_use")
+        .rename("feature_use_decay_slope"),
+        period_slope(rollup[rollup["billing_attempts"] > 0], "day", T_all, 180, n, period_days=30,
+                     value_col="collected_amount")
+        .rename("billing_amount_slope"),
+    ]).fillna(0)
+
+    # Churn labels, same rule as label_churn.py
+    labels = customers.set_index("customer_code")[["customer_id", "plan_type"]]
+    labels["tenure_days"] = days_since(T_ref, customers["signup_date"]).to_numpy()
+    labels["days_since_usage"] = days_since(T_ref, state["last_usage_date"]).fillna(999).to_numpy()
+    labels["days_since_success_payment"] = days_since(T_ref, state["last_success_payment_date"]).fillna(999).to_numpy()
+    labels = labels[labels["tenure_days"] >= MAX_INACTIVITY_DAYS].copy()
+    is_paid = labels["plan_type"] != "free"
+    labels["churn_label"] = (
+        (labels["days_since_usage"] >= MAX_INACTIVITY_DAYS)
+        & (~is_paid | (labels["days_since_success_payment"] >= MAX_INACTIVITY_DAYS))
+    ).astype(np.int64)
+    labels = labels[["customer_id", "churn_label", "tenure_days", "days_since_usage", "days_since_success_payment"]]
+
+    outputs = {
+        "churn_labels": labels,
+        "engagement_features": engagement,
+        "billing_features": billing,
+        "tickets_features": tickets,
+        "trend_features": trend,
+    }
+    for name, columns in COUNT_COLUMNS.items():
+        outputs[name] = outputs[name].astype({col: np.int64 for col in columns})
+    return outputs
+
+
+def compare_with_builders(outputs):
+    # {output: differing columns} against the full builders ("rows" when the
+    # customers differ); typed() first, as both are written through it
+    differences = {}
+    for name, builder in BUILDERS.items():
+        got, want = typed(outputs[name].copy()), typed(builder().copy())
+        if not got.index.equals(want.index):
+            differences[name] = ["rows"]
+            continue
+        differing = []
+        for col in want.columns:
+            if col not in got.columns or got[col].dtype != want[col].dtype:
+                differing.append(col)
+            elif pd.api.types.is_float_dtype(want[col]):
+                if not np.allclose(got[col], want[col], rtol=1e-5, equal_nan=True):
+                    differing.append(col)
+            elif not got[col].equals(want[col]):
+                differing.append(col)
+        if differing:
+            differences[name] = differing
+    return differences
+
+
+def write_outputs(outputs, processed_path=PROCESSED_PATH):
+    # Same files as the builders, so the modeling table joins them unchanged
+    for name, df in outputs.items():
+        write_output(df, name, processed_path)
+    build_modeling_table(from_outputs=True, data_path=processed_path).to_parquet(Path(processed_path) / "modeling_table.parquet", index=False)
+
+# -----------------------------
+# ENTRY POINTS
+# -----------------------------
+def rebuild(rollup_path=ROLLUP_PATH):
+    # One-off full-history build of the rollup store and the state
+    customers, events, subscriptions, tickets = load_tables(
+        "customers", "usage_events", "subscriptions", "support_tickets"
+    )
+    rollup_path = Path(rollup_path)
+    if rollup_path.exists():
+        for path in rollup_path.glob("*.parquet"):
+            path.unlink()
+
+    rollup = daily_rollup(events, subscriptions, tickets)
+    write_rollups(rollup, rollup_path)
+    state = update_state(None, rollup)
+    write_state(state, rollup_path)
+
+    day = rollup["day"].max()
+    return day, derive_outputs(day, customers, state, rollup_path)
+
+
+def refresh(day, events=None, subscriptions=None, tickets=None, rollup_path=ROLLUP_PATH):
+    # Folds one day's new raw rows into the store and re-derives the outputs at that day
+    customers = load_table("customers")
+    rollup = daily_rollup(events, subscriptions, tickets)
+    write_rollups(rollup, rollup_path)
+    state = update_state(read_state(rollup_path), rollup)
+    write_state(state, rollup_path)
+
+    day = pd.Timestamp(day)
+    return day, derive_outputs(day, customers, state, rollup_path)
+
+
+def read_batch(path, date_col):
+    if path is None:
+        return None
+    return pd.read_csv(path, parse_dates=[date_col])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally refresh features from daily rollups.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the rollup store from data/raw")
+    parser.add_argument("--date", help="day being refreshed (YYYY-MM-DD)")
+    parser.add_argument("--events", help="CSV of the day's new usage events")
+    parser.add_argument("--subscriptions", help="CSV of the day's new billing rows")
+    parser.add_argument("--tickets", help="CSV of the day's new support tickets")
+    parser.add_argument("--check", action="store_true",
+                        help="compare the outputs with the full builders over data/raw before writing them")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        day, outputs = rebuild()
+    elif args.date:
+        day, outputs = refresh(
+            args.date,
+            read_batch(args.events, "timestamp"),
+            read_batch(args.subscriptions, "billing_date"),
+            read_batch(args.tickets, "ticket_date"),
+        )
+    else:
+        parser.error("either --rebuild or --date is required")
+
+    if args.check:
+        differences = compare_with_builders(outputs)
+        for name, columns in differences.items():
+            print(f"[CHECK FAILED] {name}: {', '.join(columns)}")
+        if differences:
+            sys.exit(1)
+        print("Outputs match the full builders.")
+
+    write_outputs(outputs)
+    print(f"Features refreshed at {day:%Y-%m-%d}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,114 +21,215 @@
 # new customers:
 # - general rules
 
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from core.data.loader import load_table
+from core.data.partitioned import read_table
+from core.features.outputs import write_output
+from core.features.point_in_time import EventIndex
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 MAX_INACTIVITY_DAYS = 45
-RAW_PATH = Path("data/raw")
+NO_ACTIVITY_DAYS = 999
 PROCESSED_PATH = Path("data/processed")
-PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
 
-# -----------------------------
-# 1. LOAD DATA
-# -----------------------------
-customers = pd.read_csv(RAW_PATH / "customers.csv", parse_dates=["signup_date"])
-events = pd.read_csv(RAW_PATH / "usage_events.csv", parse_dates=["timestamp"])
-subscriptions = pd.read_csv(RAW_PATH / "subscriptions.csv", parse_dates=["billing_date"])
-
-# -----------------------------
-# 2. GLOBAL REFERENCE DATE
-# -----------------------------
-T_ref = max(
-    events["timestamp"].max(),
-    subscriptions["billing_date"].max()
-)
-
-# -----------------------------
-# 3. LAST USAGE DATE
-# -----------------------------
-last_usage = (
-    events.groupby("customer_id")["timestamp"]
-    .max()
-    .rename("last_usage_date")
-)
-
-# -----------------------------
-# 4. LAST SUCCESSFUL PAYMENT DATE
-# -----------------------------
-success_payments = subscriptions[subscriptions["status"] == "success"]
-
-last_success_payment = (
-    success_payments.groupby("customer_id")["billing_date"]
-    .max()
-    .rename("last_success_payment_date")
-)
-
-# -----------------------------
-# 5. MERGE BASE TABLE
-# -----------------------------
-df = customers.merge(last_usage, on="customer_id", how="left")
-df = df.merge(last_success_payment, on="customer_id", how="left")
-
-# -----------------------------
-# 6. TENURE CALCULATION
-# -----------------------------
-df["tenure_days"] = (T_ref - df["signup_date"]).dt.days
-
-# -----------------------------
-# 7. DAYS SINCE LAST ACTIVITY
-# -----------------------------
-df["days_since_usage"] = (
-    T_ref - df["last_usage_date"]
-).dt.days
-
-df["days_since_success_payment"] = (
-    T_ref - df["last_success_payment_date"]
-).dt.days
-
-# If no usage ever → treat as very high inactivity
-df["days_since_usage"] = df["days_since_usage"].fillna(999)
-# If no successful payment ever → treat as very high inactivity
-df["days_since_success_payment"] = df["days_since_success_payment"].fillna(999)
-
-# -----------------------------
-# 8. EXCLUDE NEW USERS
-# -----------------------------
-df = df[df["tenure_days"] >= MAX_INACTIVITY_DAYS].copy()
-
-# -----------------------------
-# 9. CHURN LOGIC
-# -----------------------------
-is_paid = df["plan_type"] != "free"
-
-df["churn_label"] = 0
-
-df.loc[
-    (df["days_since_usage"] >= MAX_INACTIVITY_DAYS) &
-    (
-        (~is_paid) |
-        (is_paid & (df["days_since_success_payment"] >= MAX_INACTIVITY_DAYS))
-    ),
-    "churn_label"
-] = 1
-
-# -----------------------------
-# 10. OUTPUT
-# -----------------------------
-output = df[[
-    "customer_id",
-    "churn_label",
-    "tenure_days",
-    "days_since_usage",
-    "days_since_success_payment"
-]]
-
-output.to_csv(PROCESSED_PATH / "churn_labels.csv", index=False)
-
-print("Churn labeling complete.")
-print(f"Total labeled users: {len(output)}")
-print(f"Churn rate: {output['churn_label'].mean():.2%}")
+def label_churn(min_tenure_days=MAX_INACTIVITY_DAYS):
+    # Customers with less tenure are excluded; None keeps every customer (the
+    # scoring service needs tenure_days and days_since_success_payment for all)
+    # -----------------------------
+    # 1. LOAD DATA
+    # -----------------------------
+    customers = load_table("customers")
+    events = read_table("usage_events", ["timestamp"])
+    subscriptions = read_table("subscriptions", ["billing_date", "status"])
+
+    # -----------------------------
+    # 2. GLOBAL REFERENCE DATE
+    # -----------------------------
+    T_ref = max(
+        events["timestamp"].max(),
+        subscriptions["billing_date"].max()
+    )
+
+    # -----------------------------
+    # 3. LAST USAGE DATE
+    # -----------------------------
+    last_usage = (
+        events.groupby("customer_code")["timestamp"]
+        .max()
+        .rename("last_usage_date")
+    )
+
+    # -----------------------------
+    # 4. LAST SUCCESSFUL PAYMENT DATE
+    # -----------------------------
+    success_payments = subscriptions[subscriptions["status"] == "success"]
+
+    last_success_payment = (
+        success_payments.groupby("customer_code")["billing_date"]
+        .max()
+        .rename("last_success_payment_date")
+    )
+
+    # -----------------------------
+    # 5. MERGE BASE TABLE
+    # -----------------------------
+    df = customers.join(last_usage, on="customer_code")
+    df = df.join(last_success_payment, on="customer_code")
+
+    # -----------------------------
+    # 6. TENURE CALCULATION
+    # -----------------------------
+    df["tenure_days"] = (T_ref - df["signup_date"]).dt.days
+
+    # -----------------------------
+    # 7. DAYS SINCE LAST ACTIVITY
+    # -----------------------------
+    df["days_since_usage"] = (
+        T_ref - df["last_usage_date"]
+    ).dt.days
+
+    df["days_since_success_payment"] = (
+        T_ref - df["last_success_payment_date"]
+    ).dt.days
+
+    # If no usage ever → treat as very high inactivity
+    df["days_since_usage"] = df["days_since_usage"].fillna(999)
+    # If no successful payment ever → treat as very high inactivity
+    df["days_since_success_payment"] = df["days_since_success_payment"].fillna(999)
+
+    # -----------------------------
+    # 8. EXCLUDE NEW USERS
+    # -----------------------------
+    if min_tenure_days is not None:
+        df = df[df["tenure_days"] >= min_tenure_days].copy()
+
+    # -----------------------------
+    # 9. CHURN LOGIC
+    # -----------------------------
+    is_paid = df["plan_type"] != "free"
+
+    df["churn_label"] = 0
+
+    df.loc[
+        (df["days_since_usage"] >= MAX_INACTIVITY_DAYS) &
+        (
+            (~is_paid) |
+            (is_paid & (df["days_since_success_payment"] >= MAX_INACTIVITY_DAYS))
+        ),
+        "churn_label"
+    ] = 1
+
+    # -----------------------------
+    # 10. OUTPUT
+    # -----------------------------
+    # Indexed by customer code, like the feature builders' frames
+    output = df.set_index("customer_code")[[
+        "customer_id",
+        "churn_label",
+        "tenure_days",
+        "days_since_usage",
+        "days_since_success_payment"
+    ]]
+
+    return output
+
+
+def label_churn_at(anchors, horizon_days=MAX_INACTIVITY_DAYS):
+    # Churn labels of every customer at many anchor dates T at once, in long
+    # format (one row per customer and anchor). Features look back from T
+    # (last usage / last successful payment strictly before T); the label
+    # applies the same rule forward over [T, T + horizon_days): no usage and,
+    # for paid plans, no successful payment.
+    #
+    # Usage and successful payments are sorted once by (customer, time)
+    # (EventIndex); all (customer, anchor) pairs are then answered with one
+    # searchsorted per lookup instead of one pass over the tables per anchor.
+    customers = load_table("customers")
+    events = read_table("usage_events", ["timestamp"])
+    subscriptions = read_table("subscriptions", ["billing_date", "status"])
+
+    T_ref = max(events["timestamp"].max(), subscriptions["billing_date"].max())
+    anchors = pd.DatetimeIndex(sorted(pd.Timestamp(T) for T in anchors))
+    late = anchors[anchors + pd.Timedelta(days=horizon_days) > T_ref]
+    if len(late):
+        raise ValueError(f"Anchors without a full {horizon_days}-day horizon: {list(late.date)}")
+
+    is_success = (subscriptions["status"] == "success").to_numpy()
+    usage = EventIndex(events["customer_code"].to_numpy(), events["timestamp"])
+    payments = EventIndex(
+        subscriptions["customer_code"].to_numpy()[is_success], subscriptions["billing_date"][is_success]
+    )
+
+    # -----------------------------
+    # (CUSTOMER, ANCHOR) PAIRS
+    # -----------------------------
+    # Anchor-major order; pairs before the customer's tenure reaches the
+    # inactivity window are excluded, as in label_churn
+    n_customers = len(customers)
+    codes = np.tile(customers["customer_code"].to_numpy(), len(anchors))
+    T = np.repeat(anchors.to_numpy(), n_customers)
+    tenure_days = (T - np.tile(customers["signup_date"].to_numpy(), len(anchors))) // np.timedelta64(1, "D")
+    keep = tenure_days >= MAX_INACTIVITY_DAYS
+    codes, T, tenure_days = codes[keep], T[keep], tenure_days[keep]
+
+    # -----------------------------
+    # LOOKBACK: DAYS SINCE LAST ACTIVITY BEFORE T
+    # -----------------------------
+    def days_since(index):
+        last = index.last_before(codes, T).to_numpy()
+        days = (T - last) / np.timedelta64(1, "D")
+        return np.nan_to_num(np.floor(days), nan=NO_ACTIVITY_DAYS)
+
+    # -----------------------------
+    # HORIZON: ACTIVITY IN [T, T + horizon)
+    # -----------------------------
+    horizon_end = T + np.timedelta64(horizon_days, "D")
+    no_usage = usage.count_between(codes, T, horizon_end) == 0
+    no_payment = payments.count_between(codes, T, horizon_end) == 0
+    is_paid = (customers["plan_type"] != "free").to_numpy()[codes]
+
+    return pd.DataFrame({
+        "anchor_date": T,
+        "customer_code": codes,
+        "customer_id": customers["customer_id"].to_numpy()[codes],
+        "churn_label": (no_usage & (~is_paid | no_payment)).astype(np.int64),
+        "tenure_days": tenure_days,
+        "days_since_usage": days_since(usage),
+        "days_since_success_payment": days_since(payments),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label churned customers.")
+    parser.add_argument("--anchors", nargs="*", default=None,
+                        help="anchor dates (YYYY-MM-DD): write forward-looking labels for every customer "
+                             "at each anchor to churn_labels_by_anchor.parquet")
+    parser.add_argument("--horizon-days", type=int, default=MAX_INACTIVITY_DAYS)
+    args = parser.parse_args()
+
+    PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
+
+    if args.anchors:
+        labels = label_churn_at(args.anchors, args.horizon_days)
+        labels.drop(columns="customer_code").to_parquet(PROCESSED_PATH / "churn_labels_by_anchor.parquet", index=False)
+
+        print("Churn labeling complete.")
+        print(f"Anchors: {labels['anchor_date'].nunique()}, rows: {len(labels)}")
+        print(labels.groupby("anchor_date")["churn_label"].mean().map("{:.2%}".format).to_string())
+        return
+
+    output = label_churn()
+    write_output(output, "churn_labels", PROCESSED_PATH)
+
+    print("Churn labeling complete.")
+    print(f"Total labeled users: {len(output)}")
+    print(f"Churn rate: {output['churn_label'].mean():.2%}")
+
+
+if __name__ == "__main__":
+    main()
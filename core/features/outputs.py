@@ -0,0 +1,36 @@
+# Builder outputs in data/processed
+#
+# Labels and feature builders write their frames as typed Parquet files
+# (<name>.parquet) that keep the customer code index, so the modeling table is
+# assembled by joining them on that index. The full builders and the daily
+# incremental refresh write the same files, in the same format.
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+PROCESSED_PATH = Path("data/processed")
+
+
+def typed(df):
+    # Integral columns as int32 and the rest as float32 (what the model reads)
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype(np.int32)
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def output_file(name, processed_path=PROCESSED_PATH):
+    return Path(processed_path) / f"{name}.parquet"
+
+
+def write_output(df, name, processed_path=PROCESSED_PATH):
+    Path(processed_path).mkdir(parents=True, exist_ok=True)
+    typed(df.copy()).rename_axis("customer_code").to_parquet(output_file(name, processed_path))
+
+
+def read_output(name, processed_path=PROCESSED_PATH):
+    # Indexed by customer code, as written
+    return pd.read_parquet(output_file(name, processed_path))
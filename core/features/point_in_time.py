@@ -0,0 +1,77 @@
+# Point-in-time lookups over per-customer histories
+#
+# EventIndex sorts a table's rows once by (customer code, time), packed into a
+# single int64 key: code * span + seconds since the earliest row. Any number of
+# (customer, time) queries are then one vectorized searchsorted, and window
+# counts and sums are differences of positions (or prefix sums) in that order.
+# A table can be queried at many anchor dates without being re-scanned.
+
+import numpy as np
+import pandas as pd
+
+
+NAT_SECONDS = np.datetime64("NaT", "s").astype(np.int64)
+
+
+def to_seconds(times):
+    if isinstance(times, pd.Series):
+        times = times.to_numpy()
+    return np.asarray(times, dtype="datetime64[s]").astype(np.int64)
+
+
+class EventIndex:
+    def __init__(self, codes, times, values=None, distinct_days=False):
+        codes = np.asarray(codes)
+        seconds = to_seconds(times)
+        # Rows of unknown customers and rows without a time are left out: a
+        # NaT (int64 min) would overflow span and corrupt every packed key
+        known = (codes >= 0) & (seconds != NAT_SECONDS)
+        codes, seconds = codes[known].astype(np.int64), seconds[known]
+
+        if distinct_days:
+            # Collapse to one row per (customer, calendar day)
+            seconds = seconds - seconds % 86400
+
+        self.origin = seconds.min() if len(seconds) else 0
+        self.span = (seconds.max() - self.origin + 2) if len(seconds) else 2
+        keys = codes * self.span + (seconds - self.origin)
+
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        if distinct_days:
+            self.keys, first = np.unique(self.keys, return_index=True)
+            order = order[first]
+
+        self.prefix = None
+        if values is not None:
+            values = np.asarray(values, dtype=np.float64)[known][order]
+            self.prefix = np.concatenate([[0.0], np.cumsum(values)])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def position(self, codes, times):
+        # Number of rows sorted before (customer, time): every row of a lower
+        # code plus this customer's rows strictly earlier than time
+        offsets = np.clip(to_seconds(times) - self.origin, 0, self.span - 1)
+        return np.searchsorted(self.keys, np.asarray(codes, dtype=np.int64) * self.span + offsets)
+
+    def count_between(self, codes, start, end):
+        # Rows with start <= time < end
+        return self.position(codes, end) - self.position(codes, start)
+
+    def sum_between(self, codes, start, end):
+        return self.prefix[self.position(codes, end)] - self.prefix[self.position(codes, start)]
+
+    def last_before(self, codes, time):
+        # Time of the customer's last row strictly before time, NaT if none
+        codes = np.asarray(codes, dtype=np.int64)
+        pos = self.position(codes, time) - 1
+        valid = pos >= 0
+        valid[valid] = self.keys[pos[valid]] // self.span == codes[valid]
+
+        seconds = np.zeros(len(codes), dtype=np.int64)
+        seconds[valid] = self.keys[pos[valid]] % self.span + self.origin
+        last = seconds.astype("datetime64[s]")
+        last[~valid] = np.datetime64("NaT")
+        return pd.to_datetime(last)
@@ -0,0 +1,270 @@
+# Mergeable feature statistics
+#
+# FeatureStatistics accumulates, chunk by chunk, everything needed for feature
+# means, variances, covariances / correlations and per-label means: counts,
+# sums, sums of squares and cross-products, plus per-label counts and sums.
+# Memory is O(features^2) whatever the number of rows. Two accumulators built
+# over different chunks (e.g. in different processes) merge into exactly the
+# statistics of the concatenated rows, so a large modeling table is summarised
+# in parallel, one worker per set of Parquet row groups.
+#
+# NaNs are skipped pairwise: the (i, j) entries only use rows where both
+# features are present. Values are shifted by the first chunk's means before
+# the products are summed, which keeps float64 sums accurate for features with
+# large offsets; merge() re-expresses the other side around the same shift.
+#
+# Saved statistics (save / load) are the reference for later drift checks:
+#
+#   python -m core.features.statistics --output data/processed/feature_stats.npz
+#   python -m core.features.statistics --input new_table.parquet --reference data/processed/feature_stats.npz
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from core.data.training_matrix import NON_FEATURES
+
+DATA_PATH = "data/processed"
+BATCH_ROWS = 1_000_000
+DRIFT_THRESHOLD = 0.2 # standardized mean difference flagged as drift
+
+
+class FeatureStatistics:
+    def __init__(self, feature_names):
+        k = len(feature_names)
+        self.feature_names = list(feature_names)
+        self.rows = 0
+        self.shift = None
+        # [i, j] over the rows where features i and j are both present
+        self.pair_n = np.zeros((k, k))
+        self.pair_sum = np.zeros((k, k)) # sum of shifted feature i
+        self.pair_sq = np.zeros((k, k)) # sum of shifted feature i squared
+        self.cross = np.zeros((k, k)) # sum of shifted i * shifted j
+        self.label_n = {}
+        self.label_sum = {}
+
+    def update(self, X, y=None):
+        # X: (rows, features) array, NaN for missing values; y: optional labels
+        X = np.asarray(X, dtype=np.float64)
+        present = ~np.isnan(X)
+        if self.shift is None:
+            counts = present.sum(axis=0)
+            self.shift = np.divide(np.nansum(X, axis=0), counts, out=np.zeros(X.shape[1]), where=counts > 0)
+
+        Z = np.where(present, X - self.shift, 0.0)
+        self.rows += len(Z)
+        if present.all():
+            # No missing values: the pairwise sums are the column sums
+            self.pair_n += len(Z)
+            self.pair_sum += Z.sum(axis=0)[:, None]
+            self.pair_sq += (Z * Z).sum(axis=0)[:, None]
+        else:
+            M = present.astype(np.float64)
+            self.pair_n += M.T @ M
+            self.pair_sum += Z.T @ M
+            self.pair_sq += (Z * Z).T @ M
+        self.cross += Z.T @ Z
+
+        if y is not None:
+            y = np.asarray(y)
+            for label in np.unique(y):
+                rows = y == label
+                label = label.item()
+                self.label_n[label] = self.label_n.get(label, 0) + present[rows].sum(axis=0)
+                self.label_sum[label] = self.label_sum.get(label, 0) + Z[rows].sum(axis=0)
+        return self
+
+    def merge(self, other):
+        # Adds another accumulator's rows to this one (same features)
+        if other.feature_names != self.feature_names:
+            raise ValueError("Statistics over different features cannot be merged")
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift = other.shift.copy()
+
+        # other's sums around self.shift: z' = z + d with d = other.shift - self.shift
+        d = other.shift - self.shift
+        self.cross += other.cross + other.pair_sum * d[None, :] + other.pair_sum.T * d[:, None] \
+            + other.pair_n * np.outer(d, d)
+        self.pair_sq += other.pair_sq + 2 * other.pair_sum * d[:, None] + other.pair_n * (d ** 2)[:, None]
+        self.pair_sum += other.pair_sum + other.pair_n * d[:, None]
+        self.pair_n += other.pair_n
+        self.rows += other.rows
+
+        for label, n in other.label_n.items():
+            self.label_n[label] = self.label_n.get(label, 0) + n
+            self.label_sum[label] = self.label_sum.get(label, 0) + other.label_sum[label] + n * d
+        return self
+
+    # -----------------------------
+    # DERIVED STATISTICS
+    # -----------------------------
+    def count(self):
+        return np.diag(self.pair_n).copy()
+
+    def mean(self):
+        n = self.count()
+        return np.divide(np.diag(self.pair_sum), n, out=np.full(len(n), np.nan), where=n > 0) + self.shift
+
+    def sum_of_squares(self):
+        # Of the values minus shift
+        return np.diag(self.pair_sq).copy()
+
+    def covariance(self):
+        # Pairwise-complete sample covariance, NaN where fewer than two rows
+        n = self.pair_n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = (self.cross - self.pair_sum * self.pair_sum.T / n) / (n - 1)
+        cov[n < 2] = np.nan
+        return cov
+
+    def variance(self):
+        return np.diag(self.covariance()).copy()
+
+    def correlation(self):
+        # Each pair's variances are taken over the same rows as its covariance
+        n = self.pair_n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centred_cross = self.cross - self.pair_sum * self.pair_sum.T / n
+            centred_sq = self.pair_sq - self.pair_sum ** 2 / n
+            corr = centred_cross / np.sqrt(centred_sq * centred_sq.T)
+        # Constant features have no correlation
+        corr[~np.isfinite(corr)] = np.nan
+        return np.clip(corr, -1, 1)
+
+    def label_means(self):
+        return {
+            label: np.divide(total, self.label_n[label], out=np.full(len(total), np.nan),
+                             where=self.label_n[label] > 0) + self.shift
+            for label, total in self.label_sum.items()
+        }
+
+    # -----------------------------
+    # PERSISTENCE
+    # -----------------------------
+    def save(self, path):
+        labels = sorted(self.label_n)
+        np.savez(
+            path,
+            feature_names=np.array(self.feature_names),
+            rows=self.rows,
+            shift=self.shift,
+            pair_n=self.pair_n,
+            pair_sum=self.pair_sum,
+            pair_sq=self.pair_sq,
+            cross=self.cross,
+            labels=np.array(labels),
+            label_n=np.array([self.label_n[label] for label in labels]).reshape(len(labels), -1),
+            label_sum=np.array([self.label_sum[label] for label in labels]).reshape(len(labels), -1),
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        stats = cls(data["feature_names"].tolist())
+        stats.rows = int(data["rows"])
+        stats.shift = data["shift"]
+        stats.pair_n, stats.pair_sum = data["pair_n"], data["pair_sum"]
+        stats.pair_sq, stats.cross = data["pair_sq"], data["cross"]
+        for label, n, total in zip(data["labels"].tolist(), data["label_n"], data["label_sum"]):
+            stats.label_n[label], stats.label_sum[label] = n, total
+        return stats
+
+
+def feature_columns(path):
+    schema = pq.ParquetFile(path).schema_arrow
+    return [c for c in schema.names if c not in NON_FEATURES and c != "churn_label"]
+
+
+def row_group_statistics(path, row_groups, feature_names, label="churn_label", batch_rows=BATCH_ROWS):
+    # Statistics of some of a Parquet file's row groups, one batch at a time
+    parquet = pq.ParquetFile(path)
+    has_label = label in parquet.schema_arrow.names
+    columns = [*feature_names, *([label] if has_label else [])]
+
+    stats = FeatureStatistics(feature_names)
+    for batch in parquet.iter_batches(batch_rows, row_groups=row_groups, columns=columns):
+        X = np.empty((batch.num_rows, len(feature_names)), dtype=np.float32)
+        for j, name in enumerate(feature_names):
+            X[:, j] = batch.column(name).to_numpy(zero_copy_only=False)
+        stats.update(X, batch.column(label).to_numpy() if has_label else None)
+    return stats
+
+
+def compute_statistics(path, feature_names=None, workers=None, batch_rows=BATCH_ROWS):
+    # Row groups are split into contiguous runs, one per worker, and the
+    # workers' statistics are merged in order
+    feature_names = feature_names or feature_columns(path)
+    n_groups = pq.ParquetFile(path).num_row_groups
+    workers = max(1, min(workers or os.cpu_count(), n_groups))
+    runs = [run.tolist() for run in np.array_split(np.arange(n_groups), workers)]
+
+    if workers == 1:
+        return row_group_statistics(path, runs[0], feature_names, batch_rows=batch_rows)
+
+    stats = FeatureStatistics(feature_names)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(row_group_statistics, path, run, feature_names, batch_rows=batch_rows) for run in runs]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def drift_report(reference, current, threshold=DRIFT_THRESHOLD):
+    # Per-feature mean shift in reference standard deviations
+    if reference.feature_names != current.feature_names:
+        raise ValueError("Statistics over different features cannot be compared")
+    ref_mean, ref_std = reference.mean(), np.sqrt(reference.variance())
+    cur_mean, cur_std = current.mean(), np.sqrt(current.variance())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = (cur_mean - ref_mean) / ref_std
+
+    report = pd.DataFrame({
+        "reference_mean": ref_mean,
+        "current_mean": cur_mean,
+        "reference_std": ref_std,
+        "current_std": cur_std,
+        "standardized_shift": shift,
+        "missing_share": 1 - current.count() / current.rows,
+    }, index=pd.Index(reference.feature_names, name="feature"))
+    report["drifted"] = report["standardized_shift"].abs() > threshold
+    return report.sort_values("standardized_shift", key=np.abs, ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature statistics of a modeling table, and drift against a reference.")
+    parser.add_argument("--input", default=f"{DATA_PATH}/modeling_table.parquet")
+    parser.add_argument("--output", default=None, help="save the statistics (.npz) for later drift checks")
+    parser.add_argument("--reference", default=None, help="saved statistics to check the input for drift against")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+
+    reference = FeatureStatistics.load(args.reference) if args.reference else None
+    stats = compute_statistics(
+        args.input, reference.feature_names if reference else None, args.workers, args.batch_rows
+    )
+
+    if args.output:
+        stats.save(args.output)
+        print(f"Statistics of {len(stats.feature_names)} features saved to {args.output}")
+
+    summary = pd.DataFrame(
+        {"count": stats.count(), "mean": stats.mean(), "std": np.sqrt(stats.variance())},
+        index=pd.Index(stats.feature_names, name="feature"),
+    )
+    for label, means in sorted(stats.label_means().items()):
+        summary[f"mean_churn_{label}"] = means
+    print(summary.to_string())
+
+    if reference is not None:
+        report = drift_report(reference, stats)
+        print(f"\nDrift against {args.reference}: {int(report['drifted'].sum())} of {len(report)} features drifted")
+        print(report.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# External-memory training for modeling tables larger than RAM
+#
+# ParquetBatches is an xgboost.DataIter over a modeling table's Parquet row
+# batches: XGBoost pulls one batch at a time, builds its quantile sketch and
+# pages the binned matrix to a disk cache (ExtMemQuantileDMatrix), so memory is
+# bounded by the batch size rather than the table. The train / test split is
+# the same signup-date quantile split as load_training_matrix, applied batch
+# by batch; only the signup dates of all rows (8 bytes each) are held to find
+# the cutoff.
+#
+#   python -m core.models.xgboost --external-memory --batch-rows 1000000
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+from core.data.training_matrix import NON_FEATURES, signup_dates
+from core.models.metrics import evaluate
+
+BATCH_ROWS = 1_000_000
+
+
+class ParquetBatches(xgb.DataIter):
+    # Feature / label batches of one side ('train' or 'test') of the split
+
+    def __init__(self, path, feature_names, signup_cutoff, side, batch_rows=BATCH_ROWS, cache_prefix=None):
+        self.path = path
+        self.feature_names = feature_names
+        self.signup_cutoff = signup_cutoff
+        self.side = side
+        self.batch_rows = batch_rows
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def batches(self):
+        # (X, y) arrays for this side of the split, one Parquet batch at a time
+        parquet = pq.ParquetFile(self.path)
+
+        columns = ['customer_id', 'churn_label', *self.feature_names]
+        for batch in parquet.iter_batches(self.batch_rows, columns=columns):
+            ids = batch.column('customer_id').to_numpy(zero_copy_only=False)
+            # Unknown customers (NaT signup) are on neither side, as in load_training_matrix
+            signup = signup_dates(ids)
+            side = signup <= self.signup_cutoff if self.side == 'train' else signup > self.signup_cutoff
+            rows = np.flatnonzero(side)
+            if not len(rows):
+                continue
+
+            X = np.empty((len(rows), len(self.feature_names)), dtype=np.float32)
+            for j, name in enumerate(self.feature_names):
+                X[:, j] = batch.column(name).to_numpy(zero_copy_only=False)[rows]
+            y = batch.column('churn_label').to_numpy()[rows].astype(np.int32)
+            yield X, y
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = self.batches()
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        X, y = batch
+        input_data(data=X, label=y, feature_names=self.feature_names)
+        return True
+
+    def reset(self):
+        self._batches = None
+
+
+def feature_names(path):
+    schema = pq.ParquetFile(path).schema_arrow
+    return [c for c in schema.names if c not in NON_FEATURES]
+
+
+def signup_cutoff(path, split_ratio, batch_rows=BATCH_ROWS):
+    # Signup-date quantile over the table's rows, reading only customer_id
+    dates = [
+        signup_dates(batch.column('customer_id').to_numpy(zero_copy_only=False))
+        for batch in pq.ParquetFile(path).iter_batches(batch_rows, columns=['customer_id'])
+    ]
+    # Series.quantile skips the NaT of unknown customers
+    return pd.Series(np.concatenate(dates)).quantile(split_ratio).to_datetime64()
+
+
+def train_external_memory(path, params, split_ratio=3/4, batch_rows=BATCH_ROWS, early_stopping_rounds=20):
+    # Returns (booster, metrics on the test side)
+    names = feature_names(path)
+    cutoff = signup_cutoff(path, split_ratio, batch_rows)
+
+    with tempfile.TemporaryDirectory(prefix='xgb-cache-') as cache_dir:
+        train_iter = ParquetBatches(path, names, cutoff, 'train', batch_rows, os.path.join(cache_dir, 'train'))
+        test_iter = ParquetBatches(path, names, cutoff, 'test', batch_rows, os.path.join(cache_dir, 'test'))
+        dtrain = xgb.ExtMemQuantileDMatrix(train_iter)
+        dtest = xgb.ExtMemQuantileDMatrix(test_iter, ref=dtrain)
+
+        booster_params = {k: v for k, v in params.items() if k != 'n_estimators'}
+        booster = xgb.train(
+            {
+                **booster_params,
+                'objective': 'binary:logistic',
+                'eval_metric': 'logloss',
+                'tree_method': 'hist',
+                'seed': 42,
+            },
+            dtrain,
+            num_boost_round=params.get('n_estimators', 300),
+            evals=[(dtest, 'test')],
+            early_stopping_rounds=early_stopping_rounds,
+            verbose_eval=False,
+        )
+        # The matrices own cache files in cache_dir: release them before the
+        # directory is removed
+        del dtrain, dtest, train_iter, test_iter
+
+    # Test scores are streamed batch by batch as well
+    y_test, y_score = [], []
+    for X, y in ParquetBatches(path, names, cutoff, 'test', batch_rows).batches():
+        y_test.append(y)
+        y_score.append(booster.inplace_predict(X, iteration_range=(0, booster.best_iteration + 1)))
+
+    return booster, evaluate(np.concatenate(y_test), np.concatenate(y_score))
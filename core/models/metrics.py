@@ -0,0 +1,21 @@
+# Evaluation metrics for the churn model
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+
+def precision_at_top(y_true, y_score, fraction=0.10):
+    # Share of churners among the top fraction of customers by score
+    y_true = np.asarray(y_true)
+    K = max(1, int(np.ceil(fraction * len(y_true))))
+    idx_sorted = np.argsort(-np.asarray(y_score), kind='stable')
+    return np.sum(y_true[idx_sorted[:K]] == 1) / K
+
+
+def evaluate(y_true, y_score):
+    # ROC-AUC (NaN when y_true has a single class) and Precision@Top10%
+    single_class = len(np.unique(y_true)) < 2
+    return {
+        'roc_auc': float('nan') if single_class else float(roc_auc_score(y_true, y_score)),
+        'precision_top10': float(precision_at_top(y_true, y_score)),
+    }
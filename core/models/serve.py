@@ -0,0 +1,316 @@
+# Online churn scoring service
+#
+# A small asyncio HTTP server that scores individual customers on demand:
+#   GET  /score?customer_id=<id>              -> {"customer_id": ..., "churn_score": ...}
+#   POST /score  {"customer_ids": [<id>, ...]} -> {"scores": [{...}, ...]}
+#   GET  /health
+#
+# Everything expensive happens off the request path: the model is loaded and
+# warmed at startup, and every customer's feature vector is computed with the
+# training feature builders and assembled like the modeling table (same
+# reference dates, windows and label-side columns), so online features cannot
+# drift from the ones the model was trained on and a lookup is one row of a
+# float32 matrix. Rather than caching vectors per customer, the whole matrix is
+# kept current: every --reload-seconds the raw sources' fingerprint is checked,
+# and when it changed the matrix is recomputed in a worker process and swapped
+# in while requests keep being served from the previous one.
+#
+# Concurrent requests are micro-batched: the scorer takes every request already
+# queued (and whatever arrives within --max-wait-ms, 0 by default, up to
+# --max-batch customers) and predicts them in one call.
+#
+# --check-parity compares the served vectors and scores with the modeling
+# table's rows instead of serving, and fails on any difference.
+#
+#   python -m core.models.serve --port 8080
+#   python -m core.models.serve --check-parity
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+
+from xgboost import XGBClassifier
+
+from core.data.customer_index import CustomerIndex
+from core.data.loader import customer_index, fingerprint, source_files
+from core.data.partitioned import max_time
+from core.features.build_modeling_table import FEATURE_BUILDERS, assemble
+from core.features.label_churn import label_churn
+
+MODEL_PATH = 'xgboost.xgb'
+MODELING_TABLE = 'data/processed/modeling_table.parquet'
+MAX_BATCH = 256
+MAX_WAIT_MS = 0.0
+RELOAD_SECONDS = 60
+RAW_TABLES = ('customers', 'usage_events', 'subscriptions', 'support_tickets')
+
+
+def sources_fingerprint():
+    return fingerprint([path for name in RAW_TABLES for path in source_files(name)])
+
+
+def compute_features(feature_names):
+    # (customer ids, one float32 row per customer code, as-of date, fingerprint
+    # of the sources read), exactly as for the modeling table: the same
+    # builders joined by build_modeling_table.assemble, with the label-side
+    # columns (tenure, days since payment) kept for all customers
+    key = sources_fingerprint()
+    features = assemble(label_churn(min_tenure_days=None), [builder() for builder in FEATURE_BUILDERS])
+    index = customer_index()
+    X = np.full((len(index), len(feature_names)), np.nan, dtype=np.float32)
+    X[features.index.to_numpy()] = features[list(feature_names)].to_numpy(dtype=np.float32)
+    # Reference date of the labels; each builder uses its own, as in training
+    as_of = max(max_time('usage_events'), max_time('subscriptions'))
+    return index.ids.to_numpy(), X, as_of, key
+
+
+def compute_in_worker(feature_names):
+    # A fresh process per computation: the raw tables it loads are freed with
+    # it instead of staying in the server's memory
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(compute_features, feature_names).result()
+
+
+class FeatureStore:
+    # Every customer's feature vector (see compute_features), replaced as a
+    # whole by load() when the raw sources change
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.load(*compute_in_worker(self.feature_names))
+
+    def load(self, customer_ids, X, as_of, sources):
+        # Index and matrix are swapped as one attribute, so a lookup never
+        # mixes two loads
+        self.snapshot = (CustomerIndex(customer_ids).ids, X)
+        self.as_of, self.sources = as_of, sources
+
+    def is_stale(self):
+        return sources_fingerprint() != self.sources
+
+    def vectors(self, customer_ids):
+        # float32 matrix with one row per id; rows of unknown ids are NaN and
+        # reported in the returned mask
+        ids, X = self.snapshot
+        codes = np.empty(len(customer_ids), dtype=np.int64)
+        for i, customer_id in enumerate(customer_ids):
+            # A hash lookup per id; building an Index per batch costs more
+            try:
+                codes[i] = ids.get_loc(customer_id)
+            except KeyError:
+                codes[i] = -1
+        known = codes >= 0
+        out = X[np.maximum(codes, 0)]
+        out[~known] = np.nan
+        return out, known
+
+
+async def reload_features(store, interval):
+    # Recomputes the vectors in a worker process when the raw sources change;
+    # requests are served from the current ones meanwhile
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if store.is_stale():
+                store.load(*await loop.run_in_executor(None, compute_in_worker, store.feature_names))
+                print(f"[serve] features reloaded (as of {store.as_of:%Y-%m-%d})")
+        except Exception as error:
+            print(f"[serve] feature reload failed, keeping features as of {store.as_of:%Y-%m-%d}: {error}")
+
+
+def check_parity(store, booster, path=MODELING_TABLE):
+    # Served vectors and scores against the modeling table's rows for the same
+    # customers: (rows, mismatching values per feature, largest score difference)
+    table = pd.read_parquet(path, columns=['customer_id', *store.feature_names])
+    served, _ = store.vectors(table['customer_id'].tolist())
+    expected = table[store.feature_names].to_numpy(dtype=np.float32)
+
+    mismatches = pd.Series(
+        (~np.isclose(served, expected, rtol=1e-6, equal_nan=True)).sum(axis=0), index=store.feature_names
+    )
+    score_diff = np.abs(booster.inplace_predict(served) - booster.inplace_predict(expected)).max(initial=0)
+    return len(table), mismatches, float(score_diff)
+
+
+class Scorer:
+    # Micro-batches concurrent score requests into single model calls
+
+    def __init__(self, model, store, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.booster = model.get_booster()
+        self.store = store
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+
+    async def score(self, customer_id):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((customer_id, future))
+        return await future
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                scores = self.score_batch([customer_id for customer_id, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), value in zip(batch, scores):
+                if not future.done():
+                    future.set_result(value)
+
+    def score_batch(self, customer_ids):
+        # Churn probability per id, None for unknown customers
+        X, known = self.store.vectors(customer_ids)
+        scores = np.full(len(customer_ids), np.nan, dtype=np.float32)
+        if known.any():
+            scores[known] = self.booster.inplace_predict(X[known])
+        return [float(s) if k else None for s, k in zip(scores, known)]
+
+
+def load_model(model_path=MODEL_PATH, n_jobs=1):
+    # Single-row batches are fastest on one thread; warm up the predictor once
+    model = XGBClassifier()
+    model.load_model(model_path)
+    model.set_params(n_jobs=n_jobs)
+    names = model.get_booster().feature_names
+    model.get_booster().inplace_predict(np.zeros((1, len(names)), dtype=np.float32))
+    return model
+
+
+def respond(writer, status, payload):
+    body = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+              500: 'Internal Server Error'}[status]
+    writer.write(
+        f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+
+
+async def handle(scorer, method, target, body):
+    url = urlsplit(target)
+    if url.path == '/health':
+        return 200, {'status': 'ok', 'as_of': f'{scorer.store.as_of:%Y-%m-%d}'}
+    if url.path != '/score':
+        return 404, {'error': f'unknown path {url.path}'}
+
+    if method == 'GET':
+        customer_id = parse_qs(url.query).get('customer_id', [None])[0]
+        if not customer_id:
+            return 400, {'error': 'customer_id is required'}
+        value = await scorer.score(customer_id)
+        if value is None:
+            return 404, {'error': f'unknown customer {customer_id}'}
+        return 200, {'customer_id': customer_id, 'churn_score': value}
+
+    if method == 'POST':
+        try:
+            customer_ids = json.loads(body or b'{}')['customer_ids']
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'expected {"customer_ids": [...]}'}
+        # Checked before queueing: a bad id would fail the whole micro-batch
+        if not isinstance(customer_ids, list) or not all(isinstance(c, str) for c in customer_ids):
+            return 400, {'error': 'customer_ids must be a list of strings'}
+        values = await asyncio.gather(*(scorer.score(c) for c in customer_ids))
+        return 200, {'scores': [{'customer_id': c, 'churn_score': v} for c, v in zip(customer_ids, values)]}
+
+    return 405, {'error': f'method {method} not allowed'}
+
+
+async def serve_connection(scorer, reader, writer):
+    # HTTP/1.1 with keep-alive; one request at a time per connection
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, _ = request_line.decode().split(' ', 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                key, _, value = line.decode().partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            try:
+                status, payload = await handle(scorer, method, target, body)
+            except Exception as error:
+                status, payload = 500, {'error': f'{type(error).__name__}: {error}'}
+            respond(writer, status, payload)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host, port, scorer, reload_seconds=RELOAD_SECONDS):
+    batcher = asyncio.create_task(scorer.run())
+    reloader = asyncio.create_task(reload_features(scorer.store, reload_seconds)) if reload_seconds > 0 else None
+    server = await asyncio.start_server(lambda r, w: serve_connection(scorer, r, w), host, port)
+    print(f"Scoring service listening on http://{host}:{port} (features as of {scorer.store.as_of:%Y-%m-%d})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.cancel()
+        if reloader is not None:
+            reloader.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve churn scores for individual customers over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='customers scored per model call')
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help='extra time to wait for a batch to fill (default: only what is already queued)')
+    parser.add_argument('--reload-seconds', type=float, default=RELOAD_SECONDS,
+                        help='how often to check the raw data for changes and reload the features (0: never)')
+    parser.add_argument('--check-parity', nargs='?', const=MODELING_TABLE, default=None, metavar='TABLE',
+                        help='compare served features with a modeling table instead of serving')
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    store = FeatureStore(model.get_booster().feature_names)
+
+    if args.check_parity:
+        rows, mismatches, score_diff = check_parity(store, model.get_booster(), args.check_parity)
+        print(f"Parity with {args.check_parity}: {rows} rows, max score difference {score_diff:.2e}")
+        if mismatches.any():
+            print(mismatches[mismatches > 0].to_string())
+            sys.exit(1)
+        print("Served features match the modeling table.")
+        return
+
+    scorer = Scorer(model, store, args.max_batch, args.max_wait_ms)
+    asyncio.run(serve(args.host, args.port, scorer, args.reload_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# Hyperparameter search for the XGBoost churn model
+#
+# Random search over the tree parameters, with trials running concurrently in a
+# process pool. Each worker gets nthread = cores // workers so trials never
+# oversubscribe the CPU, and builds the train / validation QuantileDMatrix
+# once (the quantile sketch is computed one time and reused by every trial the
+# worker runs). The validation rows are the latest VALID_RATIO of the training
+# split's signups; the test split is never seen here, so the metrics
+# xgboost.py reports on it stay unbiased.
+#
+# Trials stop through early_stopping_rounds, and a trial is also pruned once
+# its validation logloss is worse than the median of the finished trials at
+# the same learning progress (rounds x learning_rate), so a low learning rate
+# is not mistaken for a bad trial.
+#
+#   python -m core.models.tuning --trials 40
+#   python -m core.models.xgboost --params data/processed/tuning_results.json
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+import xgboost as xgb
+
+from core.models.metrics import evaluate
+from core.models.xgboost import PRO_DATA_PATH, load_data
+
+MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 20
+PRUNE_WARMUP = 20  # rounds before a trial can be pruned
+PRUNE_MIN_TRIALS = 3  # finished trials needed before any pruning
+VALID_RATIO = 0.2  # latest signups of the training split used for validation
+MAX_BIN = 256  # fixed: the cached quantile sketch is built with it
+
+_data = {}
+
+
+def sample_params(rng):
+    # XGBClassifier names, so the best trial can be passed straight to xgboost.py
+    return {
+        'max_depth': int(rng.integers(3, 11)),
+        'learning_rate': float(np.exp(rng.uniform(np.log(0.01), np.log(0.3)))),
+        'subsample': float(rng.uniform(0.5, 1.0)),
+        'colsample_bytree': float(rng.uniform(0.5, 1.0)),
+        'min_child_weight': float(np.exp(rng.uniform(0, np.log(20)))),
+        'reg_lambda': float(np.exp(rng.uniform(np.log(0.1), np.log(10)))),
+    }
+
+
+class MedianPruner(xgb.callback.TrainingCallback):
+    # Stops training once the validation logloss is worse than the median of
+    # the finished trials' losses at the same learning progress. references are
+    # (learning_rate, curve) pairs; a trial at round r with rate lr is compared
+    # with each curve at round r * lr / rate (its last value if shorter).
+
+    def __init__(self, learning_rate, references):
+        self.learning_rate = learning_rate
+        self.references = references
+        self.pruned = False
+
+    def after_iteration(self, model, epoch, evals_log):
+        if len(self.references) < PRUNE_MIN_TRIALS or epoch < PRUNE_WARMUP:
+            return False
+        progress = (epoch + 1) * self.learning_rate
+        losses = [
+            curve[min(max(round(progress / rate), 1), len(curve)) - 1]
+            for rate, curve in self.references
+        ]
+        self.pruned = bool(evals_log['valid']['logloss'][-1] > np.median(losses))
+        return self.pruned
+
+
+def init_worker(X_train, y_train, X_valid, y_valid, feature_names, nthread):
+    # Runs once per worker process: the matrices are shared by all its trials
+    _data['nthread'] = nthread
+    _data['train'] = xgb.QuantileDMatrix(
+        X_train, y_train, max_bin=MAX_BIN, feature_names=feature_names, nthread=nthread
+    )
+    _data['valid'] = xgb.QuantileDMatrix(
+        X_valid, y_valid, ref=_data['train'], feature_names=feature_names, nthread=nthread
+    )
+    _data['y_valid'] = y_valid
+
+
+def run_trial(trial, params, seed, references):
+    started = time.perf_counter()
+    booster_params = {
+        **params,
+        'objective': 'binary:logistic',
+        'eval_metric': 'logloss',
+        'tree_method': 'hist',
+        'max_bin': MAX_BIN,
+        'nthread': _data['nthread'],
+        'seed': seed,
+    }
+    prune = MedianPruner(params['learning_rate'], references)
+    evals_log = {}
+    booster = xgb.train(
+        booster_params,
+        _data['train'],
+        num_boost_round=MAX_ROUNDS,
+        evals=[(_data['valid'], 'valid')],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        evals_result=evals_log,
+        callbacks=[prune],
+        verbose_eval=False,
+    )
+
+    curve = evals_log['valid']['logloss']
+    best_iteration = getattr(booster, 'best_iteration', len(curve) - 1)
+    y_score = booster.predict(_data['valid'], iteration_range=(0, best_iteration + 1))
+
+    return {
+        'trial': trial,
+        'params': {**params, 'n_estimators': best_iteration + 1},
+        'logloss': float(curve[best_iteration]),
+        'pruned': prune.pruned,
+        'rounds': len(curve),
+        'seconds': round(time.perf_counter() - started, 2),
+        **evaluate(_data['y_valid'], y_score),
+        'curve': [float(v) for v in curve],
+    }
+
+
+def tune(n_trials, workers=None, seed=42):
+    # float32 views of one matrix; every worker builds its DMatrix from them.
+    # Rows are in signup order, so validation is a suffix of the training split.
+    X_train, y_train, _, _, feature_names = load_data()
+    split = int(len(y_train) * (1 - VALID_RATIO))
+    arrays = (X_train[:split], y_train[:split], X_train[split:], y_train[split:])
+
+    cores = os.cpu_count()
+    workers = max(1, min(workers or cores, n_trials))
+    nthread = max(1, cores // workers)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_trials)
+    trials = [(i, sample_params(np.random.default_rng(s)), int(s.generate_state(1)[0])) for i, s in enumerate(seeds)]
+
+    results, best, references = [], None, []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(*arrays, feature_names, nthread)) as pool:
+        pending = list(reversed(trials))
+        running = set()
+        while pending or running:
+            while pending and len(running) < workers:
+                # New trials are pruned against the trials finished so far
+                running.add(pool.submit(run_trial, *pending.pop(), list(references)))
+
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                results.append(result)
+                if not result['pruned']:
+                    references.append((result['params']['learning_rate'], result['curve']))
+                    if best is None or result['logloss'] < best['logloss']:
+                        best = result
+                print(f"[tuning] trial {result['trial']}: logloss {result['logloss']:.4f} "
+                      f"auc {result['roc_auc']:.4f} rounds {result['rounds']}"
+                      f"{' (pruned)' if result['pruned'] else ''}")
+
+    results.sort(key=lambda r: r['trial'])
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Random hyperparameter search for the churn model.')
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None, help='concurrent trials (default: all cores)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=f'{PRO_DATA_PATH}/tuning_results.json')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    best, results = tune(args.trials, args.workers, args.seed)
+    if best is None:
+        raise RuntimeError('Every trial was pruned')
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'best_params': best['params'],
+            'best_trial': best['trial'],
+            'trials': [{k: v for k, v in r.items() if k != 'curve'} for r in results],
+        }, f, indent=2)
+
+    print("Tuning complete.")
+    print(f"Best trial {best['trial']}: logloss {best['logloss']:.4f}, ROC-AUC {best['roc_auc']:.4f}, "
+          f"Precision@Top10% {best['precision_top10']:.4f}")
+    print(f"Best params: {best['params']}")
+    print(f"Pruned trials: {sum(r['pruned'] for r in results)} of {len(results)}")
+    print(f"Total time: {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,95 @@
-from core.data.splitting import get_modeling_df, get_train_test_split
-import numpy as np
+from core.data.training_matrix import load_training_matrix
+from core.models.external_memory import train_external_memory
+from core.models.metrics import evaluate
+import argparse
+import json
 
 from xgboost import XGBClassifier
-from sklearn.metrics import roc_auc_score, precision_score
 
 # Load the modeling_df
 PRO_DATA_PATH = 'data/processed'
-RAW_DATA_PATH = 'data/raw'
 TRAIN_TEST_RATIO = 3/4
-
-modeling_df = get_modeling_df(
-            f'{PRO_DATA_PATH}/modeling_table.parquet', 
-            f'{RAW_DATA_PATH}/customers.csv'
+MODEL_PATH = 'xgboost.xgb'
+
+PARAMS = {
+    'n_estimators': 300,
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+}
+
+
+def load_data():
+    # float32 feature matrix ordered by signup date: the train / test split
+    # (signup-date quantile) is a pair of row slices, so X_train and X_test are
+    # views of one array and no DataFrame copies are made
+    matrix = load_training_matrix(f'{PRO_DATA_PATH}/modeling_table.parquet', split_ratio=TRAIN_TEST_RATIO)
+
+    X_train, y_train = matrix.X[matrix.train], matrix.y[matrix.train]
+    X_test, y_test = matrix.X[matrix.test], matrix.y[matrix.test]
+
+    return X_train, y_train, X_test, y_test, matrix.feature_names
+
+
+def train_model(X_train, y_train, X_test, y_test, feature_names, params=PARAMS):
+    # Initializing and training the model
+    model = XGBClassifier(
+        **params,
+        objective='binary:logistic',
+        random_state=42,
+        early_stopping_rounds=20,
+        eval_metric='logloss'
+    )
+
+    model.fit(
+        X_train,
+        y_train,
+        eval_set=[(X_test, y_test)],
+        verbose=False
+    )
+    # Arrays carry no column names; the saved model keeps them for scoring
+    model.get_booster().feature_names = list(feature_names)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train and evaluate the XGBoost churn model.')
+    parser.add_argument('--params', default=None, help='JSON file with hyperparameters (e.g. from core.models.tuning)')
+    parser.add_argument('--external-memory', action='store_true',
+                        help='stream the modeling table in Parquet batches instead of loading it (bounded memory)')
+    parser.add_argument('--batch-rows', type=int, default=1_000_000, help='rows per batch with --external-memory')
+    args = parser.parse_args()
+
+    params = PARAMS
+    if args.params:
+        with open(args.params) as f:
+            params = {**PARAMS, **json.load(f)['best_params']}
+
+    if args.external_memory:
+        booster, metrics = train_external_memory(
+            f'{PRO_DATA_PATH}/modeling_table.parquet', params, TRAIN_TEST_RATIO, args.batch_rows
         )
+        booster.save_model(MODEL_PATH)
+        print("ROC-AUC:", metrics['roc_auc'])
+        print("Precision@Top10%:", metrics['precision_top10'])
+        return
 
-train_df, test_df = get_train_test_split(modeling_df=modeling_df, split_ratio = TRAIN_TEST_RATIO)
-
-# Drop the signup_date, churn_label and customer_id columns from train_df and test df
-X_train = train_df.drop(columns=['customer_id', 'churn_label', 'signup_date'])
-y_train = train_df['churn_label']
-
-X_test = test_df.drop(columns=['customer_id', 'churn_label', 'signup_date'])
-y_test = test_df['churn_label']
-
-
-# Initializing and training the model
-model = XGBClassifier(
-    n_estimators=300,
-    max_depth=6,
-    learning_rate=0.1,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    objective='binary:logistic',
-    random_state=42,
-    early_stopping_rounds=20,
-    eval_metric='logloss'
-)
-
-model.fit(
-    X_train,
-    y_train,
-    eval_set=[(X_test, y_test)],
-    verbose=False
-)
-
-model.save_model('xgboost.xgb')
-
-# Evaluating the trained model on AUC-ROC curve and Precision@Top10%
-model = XGBClassifier()
-model.load_model('xgboost.xgb')
+    X_train, y_train, X_test, y_test, feature_names = load_data()
+    model = train_model(X_train, y_train, X_test, y_test, feature_names, params)
+    model.save_model(MODEL_PATH)
 
-# Predict probabilities
-y_score = model.predict_proba(X_test)[:, 1]
+    # Evaluating the trained model on AUC-ROC curve and Precision@Top10%
+    model = XGBClassifier()
+    model.load_model(MODEL_PATH)
 
-# ROC-AUC
-auc = roc_auc_score(y_test, y_score)
-print("ROC-AUC:", auc)
+    # Predict probabilities
+    y_score = model.predict_proba(X_test)[:, 1]
 
-# Precision@Top10%
-n = len(X_test)
-K = max(1, int(np.ceil(0.10 * n)))
+    metrics = evaluate(y_test, y_score)
+    print("ROC-AUC:", metrics['roc_auc'])
+    print("Precision@Top10%:", metrics['precision_top10'])
 
-idx_sorted = np.argsort(-y_score)
-top_k_true = np.sum(y_test.iloc[idx_sorted[:K]] == 1)
-precision_topk = top_k_true / K
 
-print("Precision@Top10%:", precision_topk)
+if __name__ == '__main__':
+    main()
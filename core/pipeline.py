@@ -0,0 +1,223 @@
+# Feature pipeline runner
+#
+# Runs the builders that produce the modeling table as a DAG of stages. Each
+# stage declares the raw tables it loads and the processed files it reads and
+# writes; dependencies follow from those files. Stages whose inputs are ready
+# run side by side in a process pool (every builder is an importable module
+# with a main()), and a stage is skipped when its fingerprint - raw sources,
+# processed inputs and the code it runs - matches the last successful run and
+# its outputs are still there.
+#
+#   python -m core.pipeline                      # run what is out of date
+#   python -m core.pipeline modeling_table -w 4  # a target and its upstream stages
+#   python -m core.pipeline --force
+
+import argparse
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from core.data.loader import RAW_PATH, fingerprint, load_tables, source_files
+
+PROCESSED_PATH = Path("data/processed")
+STATE_FILE = ".pipeline_state.json"
+CORE_PATH = Path(__file__).resolve().parent
+
+# Modules every builder runs through; a change to any of them reruns everything
+SHARED_CODE = [
+    "data/loader.py",
+    "data/customer_index.py",
+    "data/activity_matrix.py",
+    "data/partitioned.py",
+    "features/aggregation.py",
+    "features/outputs.py",
+]
+
+
+@dataclass
+class Stage:
+    name: str
+    module: str
+    tables: tuple = ()  # raw tables loaded through core.data.loader
+    inputs: tuple = ()  # files in PROCESSED_PATH the stage reads
+    outputs: tuple = ()  # files in PROCESSED_PATH the stage writes
+    code: tuple = ()  # other modules the stage imports and runs
+    args: tuple = ()  # command-line options the stage's main() runs with
+
+
+STAGES = [
+    Stage("churn_labels", "core.features.label_churn",
+          tables=("customers", "usage_events", "subscriptions"),
+          outputs=("churn_labels.parquet",)),
+    Stage("engagement_features", "core.features.build_engagement_features",
+          tables=("customers", "usage_events", "subscriptions"),
+          outputs=("engagement_features.parquet",)),
+    Stage("billing_features", "core.features.build_billing_features",
+          tables=("customers", "usage_events", "subscriptions"),
+          outputs=("billing_features.parquet",)),
+    Stage("tickets_features", "core.features.build_ticket_features",
+          tables=("customers", "usage_events", "subscriptions", "support_tickets"),
+          outputs=("tickets_features.parquet",)),
+    Stage("trend_features", "core.features.build_trend_Features",
+          tables=("customers", "usage_events", "subscriptions", "support_tickets"),
+          outputs=("trend_features.parquet",)),
+    # Joins the outputs above on the customer code index
+    Stage("modeling_table", "core.features.build_modeling_table", args=("--from-outputs",),
+          inputs=("churn_labels.parquet", "engagement_features.parquet", "billing_features.parquet",
+                  "tickets_features.parquet", "trend_features.parquet"),
+          outputs=("modeling_table.parquet",)),
+]
+
+
+def dependencies(stages):
+    # stage name -> names of the stages producing its inputs
+    producers = {output: stage.name for stage in stages for output in stage.outputs}
+    deps = {}
+    for stage in stages:
+        missing = [f for f in stage.inputs if f not in producers]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' reads files no stage writes: {missing}")
+        deps[stage.name] = {producers[f] for f in stage.inputs}
+    return deps
+
+
+def select(stages, targets):
+    # The targets and every stage upstream of them, in declaration order
+    if not targets:
+        return list(stages)
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stages: {unknown}")
+
+    deps = dependencies(stages)
+    wanted, pending = set(), list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(deps[name])
+    return [stage for stage in stages if stage.name in wanted]
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def module_path(module):
+    return Path(importlib.util.find_spec(module).origin)
+
+
+def stage_fingerprint(stage, raw_path=RAW_PATH, processed_path=PROCESSED_PATH):
+    # Raw sources by size/mtime (like the loader cache), processed inputs by
+    # content so an upstream rerun with identical output does not cascade
+    digest = hashlib.sha1()
+    for table in stage.tables:
+        digest.update(f"{table}:{fingerprint(source_files(table, raw_path))};".encode())
+    for name in stage.inputs:
+        digest.update(f"{name}:{file_digest(Path(processed_path) / name)};".encode())
+    digest.update(f"args:{' '.join(stage.args)};".encode())
+    modules = [module_path(module) for module in (stage.module, *stage.code)]
+    for path in [*modules, *(CORE_PATH / p for p in SHARED_CODE)]:
+        digest.update(f"{path.name}:{file_digest(path)};".encode())
+    return digest.hexdigest()[:16]
+
+
+def read_state(processed_path=PROCESSED_PATH):
+    path = Path(processed_path) / STATE_FILE
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_state(state, processed_path=PROCESSED_PATH):
+    Path(processed_path).mkdir(parents=True, exist_ok=True)
+    (Path(processed_path) / STATE_FILE).write_text(json.dumps(state, indent=2, sort_keys=True))
+
+
+def run_stage(module, args=()):
+    # Runs in a worker process; options a stage does not set keep their defaults
+    sys.argv = [module, *args]
+    started = time.perf_counter()
+    importlib.import_module(module).main()
+    return time.perf_counter() - started
+
+
+def run_pipeline(targets=None, workers=None, force=False, stages=STAGES):
+    stages = select(stages, targets)
+    deps = dependencies(stages)
+    state = read_state()
+    workers = workers or os.cpu_count()
+
+    done, skipped, ran = set(), [], []
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+
+    def up_to_date(stage, key):
+        outputs_exist = all((PROCESSED_PATH / f).exists() for f in stage.outputs)
+        return not force and outputs_exist and state.get(stage.name) == key
+
+    # Raw tables are parsed (or read from the loader cache) once up front, so
+    # parallel stages never race to build the same cache file and forked
+    # workers start with the tables already in memory
+    tables = sorted({table for stage in stages for table in stage.tables})
+    load_tables(*tables)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            ready = [s for s in pending.values() if deps[s.name] <= done]
+            for stage in ready:
+                del pending[stage.name]
+                key = stage_fingerprint(stage)
+                if up_to_date(stage, key):
+                    skipped.append(stage.name)
+                    done.add(stage.name)
+                    continue
+                print(f"[pipeline] running {stage.name}")
+                running[pool.submit(run_stage, stage.module, stage.args)] = (stage, key)
+
+            if not running:
+                if ready:
+                    continue  # everything ready was skipped; look again
+                raise ValueError(f"Stages with circular inputs: {sorted(pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                elapsed = future.result()  # a failing stage stops the pipeline
+                # Fingerprint as of the run's start: inputs changed meanwhile rerun next time
+                state[stage.name] = key
+                write_state(state)
+                ran.append(stage.name)
+                done.add(stage.name)
+                print(f"[pipeline] finished {stage.name} in {elapsed:.1f}s")
+
+    return ran, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the feature pipeline, skipping up-to-date stages.")
+    parser.add_argument("targets", nargs="*", help="stages to build with their upstream stages (default: all)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="rerun stages even if they are up to date")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    ran, skipped = run_pipeline(args.targets, args.workers, args.force)
+
+    print("Pipeline complete.")
+    print(f"Ran: {', '.join(ran) or '-'}")
+    print(f"Up to date: {', '.join(skipped) or '-'}")
+    print(f"Total time: {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,167 +1,309 @@
-import random
-import uuid
-from datetime import datetime, date, timedelta
-import pandas as pd
-import numpy as np
-
-# -----------------------------
-# CONFIGS
-# -----------------------------
-NUM_CUSTOMERS = 12000
-START_DATE = datetime(2023, 1, 1)
-END_DATE = datetime(2025, 12, 31)
-
-CHURN_RATE = 0.15 # base churn rate
-PLANS = {
-    "free": {"price": 0, "churn_bias": 0.6},
-    "pro": {"price": 699, "churn_bias": 0.25},
-    "business": {"price": 1999, "churn_bias": 0.15},
-}
-
-REGIONS = ["IN", "US", "EU"]
-COMPANY_SIZES = ["10", "100", "1000", "10000"]
-
-random.seed(42)
-np.random.seed(42)
-
-# -----------------------------
-# HELPERS
-# -----------------------------
-def random_date(start, end):
-    # normalize date inputs to datetimes at midnight so subtraction works
-    if isinstance(start, date) and not isinstance(start, datetime):
-        start = datetime.combine(start, datetime.min.time())
-    if isinstance(end, date) and not isinstance(end, datetime):
-        end = datetime.combine(end, datetime.min.time())
-
-    delta = end - start
-    return start + timedelta(days=random.randint(0, delta.days))
-
-# -----------------------------
-# CUSTOMERS
-# -----------------------------
-customers = []
-
-for _ in range(NUM_CUSTOMERS):
-    cid = str(uuid.uuid4())
-    signup_date = random_date(START_DATE, END_DATE - timedelta(days=90))
-    plan = random.choices(
-        list(PLANS.keys()),
-        weights=[0.5, 0.35, 0.15],
-        k=1
-    )[0]
-
-    customers.append({
-        "customer_id": cid,
-        "signup_date": signup_date.date(),
-        "plan_type": plan,
-        "region": random.choice(REGIONS),
-        "company_size": random.choice(COMPANY_SIZES)
-    })
-
-customers_df = pd.DataFrame(customers)
-
-# -----------------------------
-# CHURN LABELING
-# -----------------------------
-customers_df["will_churn"] = customers_df["plan_type"].apply(
-    lambda p: random.random() < (CHURN_RATE + PLANS[p]["churn_bias"])
-)
-
-# -----------------------------
-# SUBSCRIPTIONS
-# -----------------------------
-subscriptions = []
-
-for _, row in customers_df.iterrows():
-    current_date = row.signup_date
-    churned = row.will_churn
-    fail_streak = 0
-
-    while current_date < END_DATE.date():
-        status = "success"
-
-        if row.plan_type != "free":
-            # Failures increase near churn
-            if churned and random.random() < 0.25:
-                status = "failed"
-                fail_streak += 1
-            else:
-                fail_streak = 0
-
-            if fail_streak >= 2:
-                break  # stop billing before churn
-
-        subscriptions.append({
-            "customer_id": row.customer_id,
-            "billing_date": current_date,
-            "amount": PLANS[row.plan_type]["price"],
-            "status": status,
-            "plan_type": row.plan_type
-        })
-
-        current_date += timedelta(days=30)
-
-subscriptions_df = pd.DataFrame(subscriptions)
-
-# -----------------------------
-# USAGE EVENTS
-# -----------------------------
-events = []
-
-for _, row in customers_df.iterrows():
-    last_active = END_DATE if not row.will_churn else END_DATE - timedelta(days=random.randint(45, 90))
-    current_date = row.signup_date
-
-    while current_date < last_active.date():
-        daily_logins = np.random.poisson(1 if row.plan_type == "free" else 2)
-
-        for _ in range(daily_logins):
-            events.append({
-                "customer_id": row.customer_id,
-                "event_type": "login",
-                "timestamp": datetime.combine(current_date, datetime.min.time())
-            })
-
-        if random.random() < 0.3:
-            events.append({
-                "customer_id": row.customer_id,
-                "event_type": "feature_use",
-                "timestamp": datetime.combine(current_date, datetime.min.time())
-            })
-
-        current_date += timedelta(days=1)
-
-events_df = pd.DataFrame(events)
-
-# -----------------------------
-# SUPPORT TICKETS
-# -----------------------------
-tickets = []
-
-for _, row in customers_df.iterrows():
-    ticket_prob = 0.05 if row.plan_type == "business" else 0.1
-
-    if random.random() < ticket_prob:
-        tickets.append({
-            "customer_id": row.customer_id,
-            "ticket_date": random_date(row.signup_date, END_DATE).date(),
-            "issue_type": random.choice(["billing", "bug", "feature"]),
-            "resolution_hours": random.randint(2, 72)
-        })
-
-tickets_df = pd.DataFrame(tickets)
-
-# -----------------------------
-# SAVE FILES
-# -----------------------------
-customers_df.drop(columns=["will_churn"]).to_csv("data/raw/customers.csv", index=False)
-subscriptions_df.to_csv("data/raw/subscriptions.csv", index=False)
-events_df.to_csv("data/raw/usage_events.csv", index=False)
-tickets_df.to_csv("data/raw/support_tickets.csv", index=False)
-
-print("Synthetic SaaS data generated successfully.")
-print(f"Customers: {len(customers_df)}")
-print(f"Subscriptions: {len(subscriptions_df)}")
-print(f"Events: {len(events_df)}")
-print(f"Tickets: {len(tickets_df)}")
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import numpy as np
+
+# -----------------------------
+# CONFIGS
+# -----------------------------
+NUM_CUSTOMERS = 12000
+START_DATE = datetime(2023, 1, 1)
+END_DATE = datetime(2025, 12, 31)
+SEED = 42
+OUTPUT_PATH = Path("data/raw")
+TABLES = ["customers", "subscriptions", "usage_events", "support_tickets"]
+
+CHURN_RATE = 0.15 # base churn rate
+PLANS = {
+    "free": {"price": 0, "churn_bias": 0.6},
+    "pro": {"price": 699, "churn_bias": 0.25},
+    "business": {"price": 1999, "churn_bias": 0.15},
+}
+PLAN_WEIGHTS = [0.5, 0.35, 0.15]
+
+REGIONS = ["IN", "US", "EU"]
+COMPANY_SIZES = ["10", "100", "1000", "10000"]
+ISSUE_TYPES = ["billing", "bug", "feature"]
+EVENT_TYPES = ["login", "feature_use"]
+PAYMENT_STATUSES = ["success", "failed"]
+
+BILLING_CYCLE_DAYS = 30
+PAYMENT_FAIL_PROB = 0.25 # per cycle, paid customers about to churn
+DAILY_LOGIN_RATE = {"free": 1, "pro": 2, "business": 2} # poisson mean
+FEATURE_USE_PROB = 0.3 # per active day
+CHURN_INACTIVITY_DAYS = (45, 90) # inclusive range of silence before END_DATE
+TICKET_PROB = {"free": 0.1, "pro": 0.1, "business": 0.05}
+RESOLUTION_HOURS = (2, 72) # inclusive
+
+# Everything below works on integer day offsets from START_DATE
+START_DAY = np.datetime64(START_DATE.date(), "D")
+TOTAL_DAYS = (END_DATE - START_DATE).days
+SIGNUP_WINDOW_DAYS = TOTAL_DAYS - 90
+
+PLAN_NAMES = np.array(list(PLANS.keys()))
+PLAN_PRICES = np.array([PLANS[p]["price"] for p in PLAN_NAMES])
+PLAN_CHURN_BIAS = np.array([PLANS[p]["churn_bias"] for p in PLAN_NAMES])
+PLAN_LOGIN_RATE = np.array([DAILY_LOGIN_RATE[p] for p in PLAN_NAMES])
+PLAN_TICKET_PROB = np.array([TICKET_PROB[p] for p in PLAN_NAMES])
+FREE_PLAN = int(np.flatnonzero(PLAN_NAMES == "free")[0])
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+UUID_HEX_POSITIONS = [i for i in range(36) if i not in (8, 13, 18, 23)]
+
+# -----------------------------
+# HELPERS
+# -----------------------------
+def to_dates(day_offsets):
+    return START_DAY + day_offsets.astype("timedelta64[D]")
+
+
+def categorical(codes, categories):
+    # Categoricals keep tens of millions of repeated strings as small integer codes
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def random_uuids(n, rng):
+    # uuid4 strings built from one block of random bytes instead of n uuid.uuid4() calls
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40 # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80 # RFC 4122 variant
+
+    nibbles = np.empty((n, 32), dtype=np.uint8)
+    nibbles[:, 0::2] = raw >> 4
+    nibbles[:, 1::2] = raw & 0x0F
+
+    chars = np.full((n, 36), ord("-"), dtype=np.uint8)
+    chars[:, UUID_HEX_POSITIONS] = HEX_DIGITS[nibbles]
+    return chars.view("S36").ravel().astype(str)
+
+
+def expand_ranges(lengths):
+    # For per-customer ranges of the given lengths, returns the owning customer
+    # and the position inside its range for every row of the flattened output
+    lengths = lengths.astype(np.int64)
+    owner = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+    starts = np.cumsum(lengths) - lengths
+    position = np.arange(len(owner), dtype=np.int32) - np.repeat(starts, lengths).astype(np.int32)
+    return owner, position
+
+
+def customer_arrays(customers_df):
+    signup = (
+        customers_df["signup_date"].to_numpy().astype("datetime64[D]") - START_DAY
+    ).astype(np.int32)
+    plan = pd.Index(PLAN_NAMES).get_indexer(customers_df["plan_type"])
+    return signup, plan, customers_df["will_churn"].to_numpy()
+
+# -----------------------------
+# CUSTOMERS
+# -----------------------------
+def generate_customers(num_customers, rng):
+    signup = rng.integers(0, SIGNUP_WINDOW_DAYS + 1, size=num_customers)
+    plan = rng.choice(len(PLAN_NAMES), size=num_customers, p=PLAN_WEIGHTS)
+
+    customers_df = pd.DataFrame({
+        "customer_id": random_uuids(num_customers, rng),
+        "signup_date": to_dates(signup),
+        "plan_type": categorical(plan, PLAN_NAMES),
+        "region": categorical(rng.integers(0, len(REGIONS), size=num_customers), REGIONS),
+        "company_size": categorical(rng.integers(0, len(COMPANY_SIZES), size=num_customers), COMPANY_SIZES),
+    })
+
+    # CHURN LABELING
+    customers_df["will_churn"] = rng.random(num_customers) < (CHURN_RATE + PLAN_CHURN_BIAS[plan])
+    return customers_df
+
+# -----------------------------
+# SUBSCRIPTIONS
+# -----------------------------
+def generate_subscriptions(customers_df, rng):
+    signup, plan, will_churn = customer_arrays(customers_df)
+
+    # One billing row every cycle from signup until END_DATE (exclusive)
+    n_cycles = -(-(TOTAL_DAYS - signup) // BILLING_CYCLE_DAYS)
+    owner, cycle = expand_ranges(n_cycles)
+
+    # Failures increase near churn
+    at_risk = (plan != FREE_PLAN) & will_churn
+    failed = at_risk[owner] & (rng.random(len(owner)) < PAYMENT_FAIL_PROB)
+
+    # Billing stops at the second failure in a row, which itself is never billed
+    second_fail = np.flatnonzero(failed[1:] & failed[:-1] & (cycle[1:] > 0)) + 1
+    stop_owner, first = np.unique(owner[second_fail], return_index=True)
+    cutoff = n_cycles.copy()
+    cutoff[stop_owner] = cycle[second_fail[first]]
+    keep = cycle < cutoff[owner]
+    owner, cycle, failed = owner[keep], cycle[keep], failed[keep]
+
+    return pd.DataFrame({
+        "customer_id": categorical(owner, customers_df["customer_id"]),
+        "billing_date": to_dates(signup[owner] + cycle * BILLING_CYCLE_DAYS),
+        "amount": PLAN_PRICES[plan[owner]],
+        "status": categorical(failed.astype(np.int8), PAYMENT_STATUSES),
+        "plan_type": categorical(plan[owner], PLAN_NAMES),
+    })
+
+# -----------------------------
+# USAGE EVENTS
+# -----------------------------
+def generate_usage_events(customers_df, rng):
+    signup, plan, will_churn = customer_arrays(customers_df)
+
+    silence = rng.integers(CHURN_INACTIVITY_DAYS[0], CHURN_INACTIVITY_DAYS[1] + 1, size=len(signup))
+    last_active = np.where(will_churn, TOTAL_DAYS - silence, TOTAL_DAYS)
+    n_days = np.clip(last_active - signup, 0, None)
+
+    # One slot per (customer, active day)
+    day_owner, day_position = expand_ranges(n_days)
+    day = signup[day_owner] + day_position
+    logins = rng.poisson(PLAN_LOGIN_RATE[plan][day_owner]).astype(np.int32)
+    feature_use = rng.random(len(day_owner)) < FEATURE_USE_PROB
+
+    # Each day emits its logins followed by at most one feature_use event
+    row_day, row_position = expand_ranges(logins + feature_use)
+    is_login = row_position < logins[row_day]
+
+    return pd.DataFrame({
+        "customer_id": categorical(day_owner[row_day], customers_df["customer_id"]),
+        "event_type": categorical((~is_login).astype(np.int8), EVENT_TYPES),
+        "timestamp": to_dates(day[row_day]).astype("datetime64[s]"),
+    })
+
+# -----------------------------
+# SUPPORT TICKETS
+# -----------------------------
+def generate_tickets(customers_df, rng):
+    signup, plan, _ = customer_arrays(customers_df)
+
+    owner = np.flatnonzero(rng.random(len(signup)) < PLAN_TICKET_PROB[plan])
+    n_tickets = len(owner)
+
+    # Ticket date drawn uniformly between signup and END_DATE (inclusive)
+    ticket_day = signup[owner] + rng.integers(0, TOTAL_DAYS - signup[owner] + 1)
+
+    return pd.DataFrame({
+        "customer_id": categorical(owner, customers_df["customer_id"]),
+        "ticket_date": to_dates(ticket_day),
+        "issue_type": categorical(rng.integers(0, len(ISSUE_TYPES), size=n_tickets), ISSUE_TYPES),
+        "resolution_hours": rng.integers(RESOLUTION_HOURS[0], RESOLUTION_HOURS[1] + 1, size=n_tickets),
+    })
+
+
+def generate_tables(num_customers, rng):
+    customers_df = generate_customers(num_customers, rng)
+
+    return {
+        "subscriptions": generate_subscriptions(customers_df, rng),
+        "usage_events": generate_usage_events(customers_df, rng),
+        "support_tickets": generate_tickets(customers_df, rng),
+        "customers": customers_df.drop(columns=["will_churn"]),
+    }
+
+
+def shard_plan(num_customers, shard_size, seed=SEED):
+    # Each shard gets its own child seed, so a shard's output depends only on
+    # (seed, shard_size, shard index) and never on which process generated it
+    sizes = [min(shard_size, num_customers - start) for start in range(0, num_customers, shard_size)]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def generate_shard(num_customers, seed_seq):
+    return generate_tables(num_customers, np.random.default_rng(seed_seq))
+
+
+def generate(num_customers=NUM_CUSTOMERS, seed=SEED):
+    # A single shard, seeded like the first shard of shard_plan; zero customers
+    # gives empty tables
+    return generate_shard(num_customers, np.random.SeedSequence(seed).spawn(1)[0])
+
+
+def iter_shards(num_customers, shard_size, seed=SEED, workers=1):
+    # Customers are generated shard by shard so only a few shards' events are ever in memory
+    plan = shard_plan(num_customers, shard_size, seed)
+    if workers <= 1:
+        for size, seed_seq in plan:
+            yield generate_shard(size, seed_seq)
+        return
+
+    # Shards are yielded in submission order, so the written output is identical
+    # for any worker count; the in-flight window keeps memory bounded
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for size, seed_seq in plan:
+            pending.append(pool.submit(generate_shard, size, seed_seq))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# -----------------------------
+# SAVE FILES
+# -----------------------------
+class ShardWriter:
+    # csv:     every shard is appended to data/raw/<table>.csv
+    # parquet: every shard becomes data/raw/<table>/part-<shard>.parquet
+    def __init__(self, output_dir, file_format="csv"):
+        self.output_dir = Path(output_dir)
+        self.file_format = file_format
+        self.rows = dict.fromkeys(TABLES, 0)
+        self.shards = 0
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for table in TABLES:
+            self._clear(table)
+
+    def _clear(self, table):
+        # Stale parts from a previous, larger run would otherwise be read back
+        if self.file_format == "parquet":
+            table_dir = self.output_dir / table
+            table_dir.mkdir(exist_ok=True)
+            for part in table_dir.glob("part-*.parquet"):
+                part.unlink()
+        else:
+            (self.output_dir / f"{table}.csv").unlink(missing_ok=True)
+
+    def write(self, tables):
+        for table, df in tables.items():
+            if self.file_format == "parquet":
+                df.to_parquet(self.output_dir / table / f"part-{self.shards:05d}.parquet", index=False)
+            else:
+                first = self.shards == 0
+                df.to_csv(self.output_dir / f"{table}.csv", mode="w" if first else "a", header=first, index=False)
+            self.rows[table] += len(df)
+        self.shards += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the synthetic SaaS churn dataset.")
+    parser.add_argument("--customers", type=int, default=NUM_CUSTOMERS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_PATH)
+    parser.add_argument("--shard-size", type=int, default=None,
+                        help="customers per shard; bounds peak memory (default: one shard)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="generator processes; 0 uses every core")
+    args = parser.parse_args()
+    if args.customers < 1:
+        parser.error("--customers must be at least 1")
+
+    shard_size = args.shard_size or max(args.customers, 1)
+    writer = ShardWriter(args.output_dir, args.format)
+    workers = args.workers or os.cpu_count()
+    for tables in iter_shards(args.customers, shard_size, args.seed, workers):
+        writer.write(tables)
+
+    print("Synthetic SaaS data generated successfully.")
+    print(f"Shards: {writer.shards}")
+    print(f"Customers: {writer.rows['customers']}")
+    print(f"Subscriptions: {writer.rows['subscriptions']}")
+    print(f"Events: {writer.rows['usage_events']}")
+    print(f"Tickets: {writer.rows['support_tickets']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# Streaming validation of incoming raw-data batches
+#
+# A daily batch of usage events, billing rows or tickets is checked chunk by
+# chunk with the same rules as validate_schema (schema, nulls, enums, future
+# dates, negative amounts, unknown customer_ids) and split: good rows are
+# appended to the raw table, bad rows go to a quarantine CSV together with the
+# checks they failed. Only the batch is read, never the table's history. A batch reaches
+# the table (and the quarantine) only once it was read completely, and batches
+# already applied are skipped by name, so a failed or repeated run never
+# leaves partial or duplicate rows.
+#
+# Customer ids are looked up in a persisted index of their 64-bit hashes
+# (data/cache/customer_ids-<fingerprint>.npy, a sorted uint64 array rebuilt
+# only when the customers source changes), so a run loads 8 bytes per customer
+# instead of parsing customers.csv.
+#
+#   python -m data.validation.stream_validator usage_events incoming/usage_events-2025-12-31.csv
+
+import argparse
+import os
+import shutil
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from core.data.loader import CACHE_PATH, RAW_PATH, fingerprint, source_files
+from data.validation.validate_schema import CHUNK_ROWS, RULES, row_violations
+
+QUARANTINE_PATH = Path("data/validation/quarantine")
+BATCH_TABLES = ["subscriptions", "usage_events", "support_tickets"]
+
+
+def hash_ids(ids):
+    return pd.util.hash_array(np.asarray(ids, dtype=object))
+
+
+class HashedIdIndex:
+    # Sorted uint64 hashes of the known customer_ids. encode() follows
+    # CustomerIndex.encode, but returns positions in the hash array (not
+    # customer codes) and -1 for unknown ids.
+
+    def __init__(self, hashes):
+        self.hashes = np.sort(hashes)
+
+    @classmethod
+    def load(cls, raw_path=RAW_PATH, cache_path=CACHE_PATH):
+        paths = source_files("customers", raw_path)
+        cache_path = Path(cache_path)
+        index_file = cache_path / f"customer_ids-{fingerprint(paths)}.npy"
+        if index_file.exists():
+            return cls(np.load(index_file))
+
+        if paths[0].suffix == ".csv":
+            ids = pd.read_csv(paths[0], usecols=["customer_id"])["customer_id"]
+        else:
+            ids = pd.concat([pd.read_parquet(p, columns=["customer_id"]) for p in paths])["customer_id"]
+        index = cls(hash_ids(ids.dropna()))
+
+        cache_path.mkdir(parents=True, exist_ok=True)
+        for stale in cache_path.glob("customer_ids-*.npy"):
+            stale.unlink(missing_ok=True)
+        tmp_file = cache_path / f".{index_file.name}.{os.getpid()}.tmp.npy"
+        np.save(tmp_file, index.hashes)
+        os.replace(tmp_file, index_file)
+        return index
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def encode(self, customer_ids):
+        ids = pd.Series(customer_ids)
+        if isinstance(ids.dtype, pd.CategoricalDtype):
+            # Hash each distinct id once instead of once per row
+            category_codes = self.encode(ids.cat.categories)
+            row_codes = ids.cat.codes.to_numpy()
+            return np.where(row_codes >= 0, category_codes[row_codes], -1).astype(np.int32)
+
+        hashes = hash_ids(ids)
+        positions = np.searchsorted(self.hashes, hashes).clip(max=len(self.hashes) - 1)
+        found = self.hashes[positions] == hashes
+        return np.where(found, positions, -1).astype(np.int32)
+
+
+def read_batch(path, chunk_rows=CHUNK_ROWS):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def split_chunk(name, chunk, index, now):
+    # (good rows, bad rows with a 'violations' column naming their failed checks)
+    violations = row_violations(name, chunk, index, now)
+
+    if any(mask is None for mask in violations.values()):
+        # Missing columns: nothing in the chunk can be appended
+        failed = ";".join(f"{check}:{col}" for (check, col), mask in violations.items() if mask is None)
+        return chunk.iloc[:0], chunk.assign(violations=failed)
+
+    bad = np.zeros(len(chunk), dtype=bool)
+    labels = np.full(len(chunk), "", dtype=object)
+    for (check, col), mask in violations.items():
+        if mask.any():
+            bad |= mask
+            labels[mask] += f"{check}:{col};"
+
+    quarantined = chunk[bad].assign(violations=[label.rstrip(";") for label in labels[bad]])
+    return chunk[~bad], quarantined
+
+
+def append_file(source, target):
+    # Appends source's bytes to target in one write pass
+    with open(source, "rb") as src, open(target, "ab") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+class RawTableWriter:
+    # Appends good rows to the raw table: to <name>.csv in its column order, or
+    # as a new Parquet part with the existing parts' schema. Rows are staged in
+    # a temporary file and only reach the table in close(commit=True), so a
+    # batch that fails part-way leaves the table untouched.
+
+    def __init__(self, name, batch_path, raw_path=RAW_PATH):
+        self.paths = source_files(name, raw_path)
+        self.columns = RULES[name]["required"]
+        self.dates = RULES[name]["dates"]
+        self.rows = 0
+        self.writer = None
+
+        if self.paths[0].suffix == ".csv":
+            self.columns = pd.read_csv(self.paths[0], nrows=0).columns.tolist()
+            self.tmp_file = self.paths[0].parent / f".{name}-{Path(batch_path).stem}.{os.getpid()}.tmp.csv"
+        else:
+            self.schema = pq.read_schema(self.paths[0]).remove_metadata()
+            self.columns = self.schema.names
+            self.part = self.paths[0].parent / f"part-{Path(batch_path).stem}.parquet"
+            self.tmp_file = self.part.parent / f".{self.part.name}.{os.getpid()}.tmp"
+
+    def write(self, good):
+        if not len(good):
+            return
+        good = good[self.columns]
+        self.rows += len(good)
+
+        if self.paths[0].suffix == ".csv":
+            good.to_csv(self.tmp_file, mode="a", header=False, index=False)
+            return
+
+        good = good.assign(**{col: pd.to_datetime(good[col]) for col in self.dates if col in self.columns})
+        table = pa.Table.from_pandas(good, schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_file, self.schema)
+        self.writer.write_table(table)
+
+    def close(self, commit=True):
+        if self.writer is not None:
+            self.writer.close()
+        if not self.tmp_file.exists():
+            return
+        if not commit:
+            self.tmp_file.unlink()
+        elif self.paths[0].suffix == ".csv":
+            append_file(self.tmp_file, self.paths[0])
+            self.tmp_file.unlink()
+        else:
+            os.replace(self.tmp_file, self.part)
+
+
+def applied_batches_file(name, raw_path=RAW_PATH):
+    # Names of the batches already appended to a table, one per line
+    return Path(raw_path) / f".{name}-applied-batches.txt"
+
+
+def validate_batch(name, batch_path, raw_path=RAW_PATH, quarantine_path=QUARANTINE_PATH,
+                   chunk_rows=CHUNK_ROWS, now=None):
+    # Returns {'rows', 'passed', 'quarantined', 'violations': {check:column -> rows},
+    # 'skipped'}. A batch whose name was already applied to the table is skipped,
+    # so re-running a day's ingest never appends its rows twice.
+    batch_name = Path(batch_path).name
+    ledger = applied_batches_file(name, raw_path)
+    if ledger.exists() and batch_name in ledger.read_text().splitlines():
+        return {"rows": 0, "passed": 0, "quarantined": 0, "violations": {}, "skipped": True}
+
+    now = pd.Timestamp(now or datetime.now())
+    index = HashedIdIndex.load(raw_path)
+    writer = RawTableWriter(name, batch_path, raw_path)
+
+    quarantine_path = Path(quarantine_path)
+    quarantine_path.mkdir(parents=True, exist_ok=True)
+    quarantine_file = quarantine_path / f"{name}.csv"
+    # Quarantined rows are staged as well and appended with the good rows
+    staged_quarantine = quarantine_path / f".{name}-{Path(batch_path).stem}.{os.getpid()}.tmp.csv"
+
+    rows, quarantined, counts = 0, 0, Counter()
+    committed = False
+    try:
+        for chunk in read_batch(batch_path, chunk_rows):
+            good, bad = split_chunk(name, chunk, index, now)
+            writer.write(good)
+
+            rows += len(chunk)
+            if len(bad):
+                quarantined += len(bad)
+                counts.update(v for label in bad["violations"] for v in label.split(";"))
+                # Fixed columns, so batches with a broken schema stay aligned
+                bad = bad.reindex(columns=[*RULES[name]["required"], "violations"])
+                bad.assign(batch=batch_name).to_csv(
+                    staged_quarantine, mode="a", header=False, index=False
+                )
+        committed = True
+    finally:
+        writer.close(commit=committed)
+        if staged_quarantine.exists():
+            if committed:
+                if not quarantine_file.exists():
+                    header = [*RULES[name]["required"], "violations", "batch"]
+                    pd.DataFrame(columns=header).to_csv(quarantine_file, index=False)
+                append_file(staged_quarantine, quarantine_file)
+            staged_quarantine.unlink()
+
+    with open(ledger, "a") as f:
+        f.write(batch_name + "\n")
+    return {"rows": rows, "passed": writer.rows, "quarantined": quarantined, "violations": dict(counts),
+            "skipped": False}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a batch of new rows and append the good ones to a raw table.")
+    parser.add_argument("table", choices=BATCH_TABLES)
+    parser.add_argument("batches", nargs="+", help="batch files (CSV or Parquet), processed in order")
+    parser.add_argument("--raw-path", default=RAW_PATH)
+    parser.add_argument("--quarantine", default=QUARANTINE_PATH, help="directory of the quarantine CSVs")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    for batch in args.batches:
+        result = validate_batch(args.table, batch, args.raw_path, args.quarantine, args.chunk_rows)
+        if result["skipped"]:
+            print(f"{batch}: already applied to {args.table}, skipped")
+            continue
+        print(f"{batch}: {result['passed']} of {result['rows']} rows appended to {args.table}, "
+              f"{result['quarantined']} quarantined")
+        for check, n in sorted(result["violations"].items()):
+            print(f"  {check}: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,144 +1,278 @@
-import pandas as pd
-from datetime import datetime
+# Raw data validation
+#
+# Every table is checked in a single vectorized pass per chunk: each rule is a
+# boolean mask over the rows (schema, nulls, enums, dates, amounts, and
+# customer_id references resolved with CustomerIndex.encode against the
+# categorical customer index). Every violation is collected with its row
+# count and a few example values into one JSON report instead of stopping at
+# the first failure. Tables stored as Parquet parts are validated part by
+# part in parallel; a single CSV is streamed in chunks that are validated in
+# the worker pool while the next chunk is read.
+#
+# The amount columns' count / mean / std are merged across chunks with
+# FeatureStatistics and included in the report.
+#
+#   python -m data.validation.validate_schema --report data/validation/report.json
+
+import argparse
+import json
+import os
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from core.data.customer_index import CustomerIndex
+from core.data.loader import read_source, source_files
+from core.features.statistics import FeatureStatistics
 
 DATA_PATH = "data/raw/"
-
-def fail(msg):
-    print(f"[DATA VALIDATION FAILED] {msg}")
-    sys.exit(1)
-
-def warn(msg):
-    print(f"[WARNING] {msg}")
-
-# -----------------------------
-# LOAD DATA
-# -----------------------------
-customers = pd.read_csv(DATA_PATH + "customers.csv", parse_dates=["signup_date"])
-subscriptions = pd.read_csv(DATA_PATH + "subscriptions.csv", parse_dates=["billing_date"])
-events = pd.read_csv(DATA_PATH + "usage_events.csv", parse_dates=["timestamp"])
-tickets = pd.read_csv(DATA_PATH + "support_tickets.csv", parse_dates=["ticket_date"])
-
-print("All files loaded successfully.")
-
-# -----------------------------
-# CUSTOMERS VALIDATION
-# -----------------------------
-required_customer_cols = {
-    "customer_id", "signup_date", "plan_type", "region", "company_size"
+REPORT_PATH = "data/validation/validation_report.json"
+CHUNK_ROWS = 1_000_000
+MAX_EXAMPLES = 5
+INACTIVITY_DAYS = 45 # churn sanity check
+MIN_CHURN_SHARE = 0.05
+NO_ACTIVITY = np.iinfo(np.int64).min # also NaT as int64
+
+RULES = {
+    "customers": {
+        "required": ["customer_id", "signup_date", "plan_type", "region", "company_size"],
+        "dates": ["signup_date"],
+        "enums": {"plan_type": {"free", "pro", "business"}},
+        "unique": ["customer_id"],
+    },
+    "subscriptions": {
+        "required": ["customer_id", "billing_date", "amount", "status", "plan_type"],
+        "dates": ["billing_date"],
+        "enums": {"status": {"success", "failed"}},
+        "non_negative": ["amount"],
+        "customer_ref": True,
+    },
+    "usage_events": {
+        "required": ["customer_id", "event_type", "timestamp"],
+        "dates": ["timestamp"],
+        "enums": {"event_type": {"login", "feature_use"}},
+        "customer_ref": True,
+    },
+    "support_tickets": {
+        "required": ["customer_id", "ticket_date", "issue_type", "resolution_hours"],
+        "dates": ["ticket_date"],
+        "enums": {"issue_type": {"billing", "bug", "feature"}},
+        "positive": ["resolution_hours"],
+        "customer_ref": True,
+    },
 }
 
-if not required_customer_cols.issubset(customers.columns):
-    fail("customers.csv schema mismatch")
-
-if customers.customer_id.isnull().any():
-    fail("Null customer_id found")
-
-if customers.signup_date.max() > datetime.now():
-    fail("Future signup_date detected")
-
-valid_plans = {"free", "pro", "business"}
-if not set(customers.plan_type.unique()).issubset(valid_plans):
-    fail("Invalid plan_type detected")
-
-print("Customers validation passed.")
-
-# -----------------------------
-# SUBSCRIPTIONS VALIDATION
-# -----------------------------
-required_sub_cols = {
-    "customer_id", "billing_date", "amount", "status", "plan_type"
-}
-
-if not required_sub_cols.issubset(subscriptions.columns):
-    fail("subscriptions.csv schema mismatch")
-
-if (subscriptions.amount < 0).any():
-    fail("Negative billing amount detected")
-
-valid_status = {"success", "failed"}
-if not set(subscriptions.status.unique()).issubset(valid_status):
-    fail("Invalid payment status detected")
-
-if subscriptions.billing_date.max() > datetime.now():
-    fail("Future billing_date detected")
-
-print("Subscriptions validation passed.")
-
-# -----------------------------
-# USAGE EVENTS VALIDATION
-# -----------------------------
-required_event_cols = {
-    "customer_id", "event_type", "timestamp"
-}
-
-if not required_event_cols.issubset(events.columns):
-    fail("usage_events.csv schema mismatch")
-
-valid_events = {"login", "feature_use"}
-if not set(events.event_type.unique()).issubset(valid_events):
-    fail("Invalid event_type detected")
-
-if events.timestamp.max() > datetime.now():
-    fail("Future event timestamp detected")
-
-print("Usage events validation passed.")
-
-# -----------------------------
-# SUPPORT TICKETS VALIDATION
-# -----------------------------
-required_ticket_cols = {
-    "customer_id", "ticket_date", "issue_type", "resolution_hours"
-}
-
-if not required_ticket_cols.issubset(tickets.columns):
-    fail("support_tickets.csv schema mismatch")
-
-if (tickets.resolution_hours <= 0).any():
-    fail("Invalid resolution_hours detected")
-
-valid_issues = {"billing", "bug", "feature"}
-if not set(tickets.issue_type.unique()).issubset(valid_issues):
-    fail("Invalid issue_type detected")
-
-print("Support tickets validation passed.")
-
-# -----------------------------
-# RELATIONAL INTEGRITY
-# -----------------------------
-customer_ids = set(customers.customer_id)
-
-for df, name in [
-    (subscriptions, "subscriptions"),
-    (events, "events"),
-    (tickets, "tickets")
-]:
-    invalid_ids = set(df.customer_id) - customer_ids
-    if invalid_ids:
-        fail(f"{name} contains unknown customer_ids")
-
-print("Relational integrity checks passed.")
-
-# -----------------------------
-# CHURN SANITY CHECK
-# -----------------------------
-# Rule: churned users should have inactivity >= 45 days
-last_event = (
-    events.groupby("customer_id")["timestamp"]
-    .max()
-    .reset_index(name="last_activity")
-)
-
-merged = customers.merge(last_event, on="customer_id", how="left")
-merged["inactivity_days"] = (
-    datetime.now() - merged["last_activity"]
-).dt.days
-
-churn_like = merged[merged.inactivity_days >= 45]
-
-if churn_like.shape[0] / customers.shape[0] < 0.05:
-    warn("Churn population seems unusually low")
-
-print("Churn sanity check passed.")
-
-print("\n✅ ALL DATA VALIDATION CHECKS PASSED SUCCESSFULLY")
+_index = {}
+
+
+def row_violations(name, df, index, now):
+    # {(check, column): boolean mask of offending rows}; a missing column is a
+    # ("schema", column) entry with mask None
+    rules = RULES[name]
+    violations = {}
+
+    for col in rules["required"]:
+        if col not in df.columns:
+            violations[("schema", col)] = None
+
+    def has(col):
+        return col in df.columns
+
+    # A null in any required column is a violation of its own: the date and
+    # amount checks below let nulls through
+    for col in rules["required"]:
+        if has(col):
+            violations[("null", col)] = df[col].isna().to_numpy()
+
+    if has("customer_id") and rules.get("customer_ref"):
+        ids = df["customer_id"].astype("category")
+        violations[("unknown_customer", "customer_id")] = (
+            (index.encode(ids) < 0) & ids.notna().to_numpy()
+        )
+    for col in rules.get("unique", []):
+        if has(col):
+            violations[("duplicate", col)] = df[col].duplicated().to_numpy()
+
+    for col in rules.get("dates", []):
+        if has(col):
+            dates = pd.to_datetime(df[col], errors="coerce")
+            violations[("invalid_date", col)] = (dates.isna() & df[col].notna()).to_numpy()
+            violations[("future_date", col)] = (dates > now).to_numpy()
+
+    for col, allowed in rules.get("enums", {}).items():
+        if has(col):
+            violations[("invalid_value", col)] = (~df[col].isin(list(allowed))).to_numpy()
+
+    for col in rules.get("non_negative", []):
+        if has(col):
+            violations[("negative", col)] = (pd.to_numeric(df[col], errors="coerce") < 0).to_numpy()
+    for col in rules.get("positive", []):
+        if has(col):
+            violations[("not_positive", col)] = (pd.to_numeric(df[col], errors="coerce") <= 0).to_numpy()
+
+    return violations
+
+
+def summarize(df, violations):
+    # {(check, column): [rows, examples]} for the checks that found something
+    summary = {}
+    for key, mask in violations.items():
+        if mask is None:
+            summary[key] = [None, []]
+        elif mask.any():
+            check, col = key
+            examples = df[col].to_numpy()[mask][:MAX_EXAMPLES]
+            summary[key] = [int(mask.sum()), [str(v) for v in examples]]
+    return summary
+
+
+def last_activity(events, index):
+    # Latest event per customer code (int64 ns, NO_ACTIVITY when none); folded
+    # across chunks with np.maximum for the churn sanity check
+    last = np.full(len(index), NO_ACTIVITY, dtype=np.int64)
+    if {"customer_id", "timestamp"} <= set(events.columns):
+        codes = index.encode(events["customer_id"].astype("category"))
+        times = pd.to_datetime(events["timestamp"], errors="coerce").to_numpy().astype("datetime64[ns]").view(np.int64)
+        valid = (codes >= 0) & (times != NO_ACTIVITY)
+        np.maximum.at(last, codes[valid], times[valid])
+    return last
+
+
+def init_worker(customer_ids):
+    _index["customers"] = CustomerIndex(customer_ids)
+
+
+def numeric_statistics(name, chunk):
+    # Mergeable statistics of the table's amount columns, None if it has none
+    rules = RULES[name]
+    columns = [c for c in rules.get("non_negative", []) + rules.get("positive", []) if c in chunk.columns]
+    if not columns:
+        return None
+    values = chunk[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    return FeatureStatistics(columns).update(values)
+
+
+def validate_chunk(name, chunk, now):
+    # chunk is a DataFrame, or the path of a Parquet part read in the worker
+    if not isinstance(chunk, pd.DataFrame):
+        chunk = pd.read_parquet(chunk)
+    index = _index["customers"]
+    summary = summarize(chunk, row_violations(name, chunk, index, now))
+    last = last_activity(chunk, index) if name == "usage_events" else None
+    return len(chunk), summary, numeric_statistics(name, chunk), last
+
+
+def iter_chunks(name, raw_path, chunk_rows=CHUNK_ROWS):
+    # A single CSV is streamed in chunks; Parquet parts are handed to the
+    # workers as paths so each one is read in parallel
+    paths = source_files(name, raw_path)
+    if paths[0].suffix == ".csv":
+        yield from pd.read_csv(paths[0], chunksize=chunk_rows)
+    else:
+        yield from paths
+
+
+def merge(total, summary):
+    for key, (rows, examples) in summary.items():
+        if key not in total:
+            total[key] = [rows, examples]
+            continue
+        if rows is not None:
+            total[key][0] += rows
+        total[key][1] = (total[key][1] + examples)[:MAX_EXAMPLES]
+    return total
+
+
+def table_report(rows, summary, stats=None):
+    report = {
+        "rows": rows,
+        "violations": [
+            {"check": check, "column": col, "rows": n, "examples": examples}
+            for (check, col), (n, examples) in sorted(summary.items())
+        ],
+    }
+    if stats is not None:
+        report["statistics"] = {
+            col: {"count": int(n), "mean": float(mean), "std": float(std)}
+            for col, n, mean, std in zip(stats.feature_names, stats.count(), stats.mean(), np.sqrt(stats.variance()))
+        }
+    return report
+
+
+def validate(raw_path=DATA_PATH, workers=None, chunk_rows=CHUNK_ROWS, now=None):
+    now = pd.Timestamp(now or datetime.now())
+    workers = workers or os.cpu_count()
+    report = {"generated_at": str(now), "tables": {}, "warnings": []}
+
+    customers = read_source("customers", source_files("customers", raw_path))
+    init_worker(customers["customer_id"].dropna().unique())
+    rows, summary, stats, _ = validate_chunk("customers", customers, now)
+    report["tables"]["customers"] = table_report(rows, summary, stats)
+
+    index = _index["customers"]
+    last = np.full(len(index), NO_ACTIVITY, dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(index.ids.to_numpy(),)) as pool:
+        for name in ["subscriptions", "usage_events", "support_tickets"]:
+            rows, summary, stats, pending = 0, {}, None, deque()
+
+            def collect(future):
+                nonlocal rows, stats
+                chunk_rows, chunk_summary, chunk_stats, chunk_last = future.result()
+                rows += chunk_rows
+                merge(summary, chunk_summary)
+                if chunk_stats is not None:
+                    stats = chunk_stats if stats is None else stats.merge(chunk_stats)
+                if chunk_last is not None:
+                    np.maximum(last, chunk_last, out=last)
+
+            for chunk in iter_chunks(name, raw_path, chunk_rows):
+                pending.append(pool.submit(validate_chunk, name, chunk, now))
+                # Bounded read-ahead: at most two chunks per worker in flight
+                if len(pending) > 2 * workers:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+            report["tables"][name] = table_report(rows, summary, stats)
+
+    # Churn sanity check: share of customers inactive for INACTIVITY_DAYS or more
+    cutoff = (now - pd.Timedelta(days=INACTIVITY_DAYS)).value
+    # Customers without any event have no inactivity and are not counted as churn-like
+    churn_like = (last != NO_ACTIVITY) & (last <= cutoff)
+    if len(last) and churn_like.mean() < MIN_CHURN_SHARE:
+        report["warnings"].append("Churn population seems unusually low")
+
+    report["passed"] = not any(t["violations"] for t in report["tables"].values())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the raw data tables.")
+    parser.add_argument("--raw-path", default=DATA_PATH)
+    parser.add_argument("--report", default=REPORT_PATH, help="where to write the JSON report")
+    parser.add_argument("--workers", type=int, default=None, help="validation processes (default: all cores)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk for CSV sources")
+    args = parser.parse_args()
+
+    report = validate(args.raw_path, args.workers, args.chunk_rows)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, table in report["tables"].items():
+        for v in table["violations"]:
+            rows = "missing column" if v["rows"] is None else f"{v['rows']} rows"
+            print(f"[DATA VALIDATION FAILED] {name}.{v['column']}: {v['check']} ({rows})")
+        if not table["violations"]:
+            print(f"{name} validation passed ({table['rows']} rows).")
+    for warning in report["warnings"]:
+        print(f"[WARNING] {warning}")
+    print(f"Report written to {args.report}")
+
+    if not report["passed"]:
+        sys.exit(1)
+    print("\n✅ ALL DATA VALIDATION CHECKS PASSED SUCCESSFULLY")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import pandas as pd
+
+from core.features.aggregation import PeriodSlopeAccumulator, period_slope
+
+
+def test_period_slope_leaves_out_rows_after_t_ref():
+    times = pd.to_datetime(["2025-01-06", "2025-01-07", "2025-01-14", "2025-01-20", "2025-03-01"])
+    df = pd.DataFrame({"customer_code": [0, 0, 0, 0, 0], "timestamp": times})
+    t_ref = pd.Timestamp("2025-01-20")
+
+    # Within the window: period 0 has two rows, periods 1 and 2 one each
+    expected = period_slope(df[df["timestamp"] <= t_ref], "timestamp", t_ref, 56, 1)
+    assert period_slope(df, "timestamp", t_ref, 56, 1).tolist() == expected.tolist()
+    assert expected.iloc[0] != 0
+
+    accumulator = PeriodSlopeAccumulator("timestamp", t_ref, 56, 1)
+    accumulator.update(df.iloc[:2])
+    accumulator.update(df.iloc[2:])
+    assert accumulator.result().tolist() == expected.tolist()
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from core.features.point_in_time import EventIndex
+
+
+def test_null_times_are_left_out():
+    codes = np.array([0, 0, 1, 1, -1])
+    times = pd.Series(pd.to_datetime(["2025-01-01", None, "2025-01-05", "2025-01-10", "2025-01-02"]))
+    index = EventIndex(codes, times, values=[1.0, 100.0, 2.0, 3.0, 50.0])
+
+    query = np.array([0, 1])
+    start = np.full(2, np.datetime64("2024-12-01"))
+    end = np.full(2, np.datetime64("2025-02-01"))
+
+    assert len(index) == 3
+    assert index.count_between(query, start, end).tolist() == [1, 2]
+    assert index.sum_between(query, start, end).tolist() == [1.0, 5.0]
+    assert list(index.last_before(query, end)) == [pd.Timestamp("2025-01-01"), pd.Timestamp("2025-01-10")]
+
+
+def test_distinct_days_with_null_times():
+    codes = np.array([0, 0, 0])
+    times = pd.Series(pd.to_datetime(["2025-01-01 08:00", "2025-01-01 17:00", None]))
+    index = EventIndex(codes, times, distinct_days=True)
+
+    assert len(index) == 1